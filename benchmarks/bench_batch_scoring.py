@@ -0,0 +1,80 @@
+# Throughput (users per second) of BggSuggestions.suggest_for_users for different numbers of worker processes, on
+# synthetic collections scored against a synthetic hotness snapshot (no network: the collections are passed already
+# loaded, so only the scoring is measured).
+# NB: the scaling is bounded by the cores available (os.cpu_count() is printed)
+#
+# usage (from the repository root):
+#   python -m benchmarks.bench_batch_scoring [--users 200] [--games 300] [--processes 1,2,4,8] [--source hotness]
+import argparse
+import os
+import random
+import time
+from benchmarks import synthetic
+from core.bgg_api_manager import STORED_INFO
+from core.bgg_catalog_index import CatalogManager, build_catalog_index
+from core.bgg_hotness import HotnessManager
+from core.bgg_records import Game, intern_features
+from core.bgg_suggestions import BggSuggestions
+from core.bgg_xml_parser import iter_thing_items
+
+
+def synthetic_games(ids):
+    return [
+        Game(
+            id=id_, name=record["name"], features=intern_features(record["features"]),
+            description=record["description"], thumbnail=record["thumbnail"]
+        ) for id_, record in iter_thing_items(synthetic.thing_xml(ids), STORED_INFO)
+    ]
+
+
+class _StaticCatalog(CatalogManager):
+    def __init__(self, catalog_index):
+        super().__init__()
+        self._index = catalog_index
+
+    def refresh(self):
+        return self._index
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--games", type=int, default=300, help="boardgames in each collection")
+    parser.add_argument("--processes", default="1,2,4,8")
+    parser.add_argument("--source", default="hotness", choices=["hotness", "catalog"])
+    parser.add_argument("--catalog-size", type=int, default=20000)
+    args = parser.parse_args()
+
+    hot_boardgames = synthetic_games(synthetic.hot_ids())
+    hotness = HotnessManager(loader=lambda: hot_boardgames)
+    catalog = CatalogManager()
+    if args.source == "catalog":
+        catalog_games = synthetic_games(range(1, args.catalog_size + 1))
+        catalog = _StaticCatalog(build_catalog_index(
+            (g.id, {"features": g.features, "name": g.name, "description": g.description, "thumbnail": g.thumbnail})
+            for g in catalog_games
+        ))
+    bgg_suggestions = BggSuggestions(hotness=hotness, source=args.source, catalog=catalog)
+
+    # the collections are sampled from the same boardgames, so they overlap as the real ones do
+    all_games = synthetic_games(range(1, args.games * 10))
+    rng = random.Random(0)
+    collections = {
+        f"user_{u}": [g._replace(numplays=int(rng.expovariate(0.3))) for g in rng.sample(all_games, args.games)]
+        for u in range(args.users)
+    }
+
+    print(f"{args.users} users x {args.games} boardgames, source {args.source}, {os.cpu_count()} cores")
+    print(f"{'processes':>10}{'seconds':>10}{'users/s':>10}{'speedup':>10}")
+    baseline = None
+    for processes in [int(p) for p in args.processes.split(",")]:
+        start = time.perf_counter()
+        results = bgg_suggestions.suggest_for_users(collections=collections, processes=processes)
+        elapsed = time.perf_counter() - start
+        assert len(results) == args.users
+        baseline = baseline or elapsed
+        print(f"{processes:>10}{elapsed:>10.2f}{args.users / elapsed:>10.1f}{baseline / elapsed:>10.2f}")
+
+
+if __name__ == '__main__':
+    main()
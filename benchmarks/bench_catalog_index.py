@@ -0,0 +1,112 @@
+# Build time and query latency of the catalog inverted index (core/bgg_catalog_index.py) on synthetic catalogs:
+# - build: from a FeatureStore filled with synthetic /thing records (as the ingestion leaves it) to the CatalogIndex
+# - query: rank_catalog for collections of different sizes, against the brute force scoring of every catalog
+#   boardgame (the affinity_matrix cross join extended to the whole catalog), when it fits in memory
+# the postings column is the fraction of the index postings walked by each query.
+#
+# usage (from the repository root):
+#   python -m benchmarks.bench_catalog_index [--catalog-sizes 10000,50000] [--liked-sizes 10,100,1000] [--repeat 5]
+import argparse
+import os
+import random
+import tempfile
+import time
+import numpy as np
+from benchmarks import synthetic
+from core.bgg_affinity import encode_features
+from core.bgg_api_manager import STORED_INFO, THING_CHUNK_SIZE
+from core.bgg_catalog_index import build_catalog_index, rank_catalog
+from core.bgg_feature_store import FeatureStore
+from core.bgg_records import Game, intern_features
+from core.bgg_xml_parser import iter_thing_items
+
+
+MAX_BRUTE_FORCE_PAIRS = 2 * 10**7  # catalog x liked affinities computed by the brute force scoring
+
+
+def fill_store(store, n_games):
+    for start in range(1, n_games + 1, THING_CHUNK_SIZE * 50):
+        ids = range(start, min(start + THING_CHUNK_SIZE * 50, n_games + 1))
+        store.put_many({
+            id_: {k: record[k] for k in ["features"] + STORED_INFO}
+            for id_, record in iter_thing_items(synthetic.thing_xml(ids), STORED_INFO)
+        })
+
+
+def liked_collection(catalog_index, n_liked, seed=0):
+    rng = random.Random(seed)
+    return [
+        Game(id=b.id, name=b.name, features=intern_features(b.features), numplays=int(rng.expovariate(0.3)))
+        for b in rng.sample(catalog_index.boardgames, n_liked)
+    ]
+
+
+def brute_force(catalog_index, liked_boardgames):
+    liked_matrix = encode_features(
+        [g.features for g in liked_boardgames], catalog_index.vocabulary, grow=False, binary=True
+    )
+    common = (catalog_index.matrix @ liked_matrix.T).toarray().astype(float)
+    affinity = common / np.maximum(catalog_index.n_features, 1)[:, None]
+    weights = np.array([g.numplays for g in liked_boardgames], dtype=float) + 0.5
+    total = (affinity * weights[None, :]).sum(axis=1)
+    return np.argsort(-total, kind='stable')[:50]
+
+
+def percentiles_ms(latencies):
+    latencies = np.array(latencies) * 1000
+    return np.percentile(latencies, 50), np.percentile(latencies, 95)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--catalog-sizes", default="10000,50000")
+    parser.add_argument("--liked-sizes", default="10,100,1000")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"{'catalog':>8}{'build s':>9}{'games/s':>10}{'postings':>11}{'index MB':>10}")
+    indexes = {}
+    for n_games in [int(n) for n in args.catalog_sizes.split(",")]:
+        store = FeatureStore(path=os.path.join(tempfile.mkdtemp(), "catalog.sqlite"), max_entries=None)
+        fill_store(store, n_games)
+        start = time.perf_counter()
+        catalog_index = build_catalog_index(store.iter_records(), version=store.fingerprint())
+        elapsed = time.perf_counter() - start
+        size_mb = sum(
+            m.data.nbytes + m.indices.nbytes + m.indptr.nbytes for m in [catalog_index.matrix, catalog_index.postings]
+        ) / 1024 / 1024
+        print(f"{n_games:>8}{elapsed:>9.2f}{n_games / elapsed:>10,.0f}{catalog_index.postings.nnz:>11,}"
+              f"{size_mb:>10.1f}")
+        indexes[n_games] = catalog_index
+        store.close()
+
+    print()
+    print(f"{'catalog':>8}{'liked':>7}{'mode':>14}{'p50 ms':>9}{'p95 ms':>9}{'postings':>10}"
+          f"{'brute p50 ms':>14}")
+    for n_games, catalog_index in indexes.items():
+        for n_liked in [int(n) for n in args.liked_sizes.split(",")]:
+            liked_boardgames = liked_collection(catalog_index, n_liked)
+            for mode in ["sum_weighted", "max"]:
+                latencies = []
+                for _ in range(args.repeat):
+                    start = time.perf_counter()
+                    rank_catalog(catalog_index, liked_boardgames, mode=mode)
+                    latencies.append(time.perf_counter() - start)
+                features = np.unique(encode_features(
+                    [g.features for g in liked_boardgames], catalog_index.vocabulary, grow=False
+                ).indices)
+                visited = catalog_index.postings[:, features].nnz / catalog_index.postings.nnz
+                brute_text = "-"
+                if mode == "sum_weighted" and n_games * n_liked <= MAX_BRUTE_FORCE_PAIRS:
+                    brute_latencies = []
+                    for _ in range(args.repeat):
+                        start = time.perf_counter()
+                        brute_force(catalog_index, liked_boardgames)
+                        brute_latencies.append(time.perf_counter() - start)
+                    brute_text = f"{percentiles_ms(brute_latencies)[0]:.1f}"
+                p50, p95 = percentiles_ms(latencies)
+                print(f"{n_games:>8}{n_liked:>7}{mode:>14}{p50:>9.1f}{p95:>9.1f}{visited:>10.1%}{brute_text:>14}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+# Bytes per cached collection with the original records (list of dicts, each with a list of {"type","id","value"}
+# dicts, whose strings come from a separate parsing for each collection) against the compact Game/Feature records of
+# core/bgg_records.py (NamedTuples, with the Features interned in the global vocabulary).
+#
+# usage (from the repository root): python -m benchmarks.bench_records_memory [--n-collections 10] [--n-games 300]
+import argparse
+import random
+import tracemalloc
+from core.bgg_records import Game, intern_features
+
+
+FEATURE_TYPES = ["boardgamecategory", "boardgamemechanic", "boardgamefamily", "boardgamedesigner"]
+
+
+# a fresh copy of the string, as if it was parsed again from another response
+def _parsed(value):
+    return value.encode().decode()
+
+
+def synthetic_catalog(n_games, n_features=3000, features_per_game=12, seed=0):
+    rng = random.Random(seed)
+    features = [(rng.choice(FEATURE_TYPES), str(i), f"Feature number {i}") for i in range(n_features)]
+    return [
+        (str(i), f"Boardgame {i}", rng.sample(features, features_per_game), rng.randint(0, 20))
+        for i in range(n_games)
+    ]
+
+
+def dict_collection(games):
+    return [
+        {
+            "id": _parsed(id_),
+            "name": _parsed(name),
+            "features": [{"type": _parsed(t), "id": _parsed(f), "value": _parsed(v)} for t, f, v in features],
+            "numplays": numplays
+        } for id_, name, features, numplays in games
+    ]
+
+
+def game_collection(games):
+    return [
+        Game(
+            id=_parsed(id_),
+            name=_parsed(name),
+            features=intern_features([{"type": _parsed(t), "id": _parsed(f), "value": _parsed(v)}
+                                      for t, f, v in features]),
+            numplays=numplays
+        ) for id_, name, features, numplays in games
+    ]
+
+
+def measure(build, collections_games):
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    cache = [build(games) for games in collections_games]
+    used = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    return used / len(cache), cache
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--n-collections", type=int, default=10)
+    parser.add_argument("--n-games", type=int, default=300)
+    args = parser.parse_args()
+
+    # the collections are sampled from the same catalog, so they overlap as the real ones do
+    catalog = synthetic_catalog(args.n_games * 5)
+    rng = random.Random(1)
+    collections_games = [rng.sample(catalog, args.n_games) for _ in range(args.n_collections)]
+
+    dict_bytes, _ = measure(dict_collection, collections_games)
+    game_bytes, _ = measure(game_collection, collections_games)
+    print(f"{args.n_collections} cached collections of {args.n_games} games")
+    print(f"{'records':<20}{'bytes per collection':>24}{'bytes per game':>18}")
+    for label, used in [("list of dicts", dict_bytes), ("Game/Feature", game_bytes)]:
+        print(f"{label:<20}{used:>24,.0f}{used / args.n_games:>18,.0f}")
+    print(f"ratio: {dict_bytes / game_bytes:.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,90 @@
+# Startup time of the core library, as the bot sees it: each run is a fresh interpreter (against the local stand-in
+# BGG API, benchmarks/mock_server.py) that measures
+# - import: import core.bgg_suggestions
+# - ready: import + BggSuggestions() (the bot starts polling right after it)
+# - first suggestion: until the hotness snapshot is available (the first request can be served)
+# in two scenarios:
+# - cold: nothing on disk (empty feature store, no persisted hotness list): the hotness list is loaded in background
+# - persisted: the feature store and the hotness list persisted by a previous run
+# NB: the hotness list is always loaded in background, so 'ready' doesn't depend on the scenario nor on the API latency
+#
+# usage (from the repository root):
+#   python -m benchmarks.bench_startup [--repeat 5] [--latency 0.1]
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import numpy as np
+from benchmarks.mock_server import MockBggServer
+
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SCENARIOS = ["cold", "persisted"]
+
+
+# CHILD SIDE: it runs with its own feature store and persisted hotness list (BGG_FEATURE_STORE_PATH and
+# BGG_HOTNESS_SNAPSHOT_PATH in a temporary directory)
+def run_startup():
+    start = time.perf_counter()
+    from core.bgg_suggestions import BggSuggestions
+    imported = time.perf_counter()
+    bgg_suggestions = BggSuggestions()
+    ready = time.perf_counter()
+    bgg_suggestions.hotness.get()
+    first_suggestion = time.perf_counter()
+    # the persisted scenario needs a persisted hotness list, written by a complete refresh
+    while bgg_suggestions.hotness.status()["refreshing"]:
+        time.sleep(0.01)
+    return {"import": imported - start, "ready": ready - start, "first_suggestion": first_suggestion - start}
+
+
+# PARENT SIDE
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--latency", type=float, default=0.1, help="seconds added to each mock API response")
+    parser.add_argument("--run-startup", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_startup:
+        print(json.dumps(run_startup()))
+        return
+
+    server = MockBggServer(latency=args.latency).start()
+    env = {**os.environ, "BGG_API_URL": server.url, "PYTHONPATH": ROOT_DIR}
+    print(f"{'scenario':<12}{'import s':>10}{'ready s':>10}{'first suggestion s':>20}")
+    try:
+        for scenario in SCENARIOS:
+            results = []
+            for _ in range(args.repeat):
+                working_dir = tempfile.mkdtemp()
+                run_env = {
+                    **env,
+                    "BGG_FEATURE_STORE_PATH": os.path.join(working_dir, "feature_store.sqlite"),
+                    "BGG_HOTNESS_SNAPSHOT_PATH": os.path.join(working_dir, "hotness_snapshot.pickle"),
+                }
+                if scenario == "persisted":
+                    # a previous run fills the feature store and persists the hotness list
+                    subprocess.run(
+                        [sys.executable, "-m", "benchmarks.bench_startup", "--run-startup"],
+                        check=True, capture_output=True, cwd=ROOT_DIR, env=run_env
+                    )
+                output = subprocess.run(
+                    [sys.executable, "-m", "benchmarks.bench_startup", "--run-startup"],
+                    check=True, capture_output=True, text=True, cwd=ROOT_DIR, env=run_env
+                ).stdout
+                results.append(json.loads(output.strip().splitlines()[-1]))
+                shutil.rmtree(working_dir)
+            medians = {k: float(np.median([r[k] for r in results])) for k in results[0]}
+            print(f"{scenario:<12}{medians['import']:>10.2f}{medians['ready']:>10.2f}"
+                  f"{medians['first_suggestion']:>20.2f}")
+    finally:
+        server.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,105 @@
+# Parse time and peak memory of the BeautifulSoup parsing (the original one) against the streaming lxml parsers of
+# core/bgg_xml_parser.py, on the fixtures in benchmarks/fixtures scaled up to n_items items.
+# Each measure runs in a fresh interpreter, so that the peak RSS of one parser doesn't hide the other one.
+# NB: it requires beautifulsoup4, no longer needed by the core library
+#
+# usage (from the repository root): python -m benchmarks.bench_xml_parsing [--n-items 5000] [--repeat 3]
+import argparse
+import os
+import re
+import resource
+import subprocess
+import sys
+import time
+
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FIXTURES_DIR = os.path.join(ROOT_DIR, "benchmarks", "fixtures")
+FIXTURES = ["collection", "thing", "hot", "search"]
+
+
+# it replicates the <item> elements of the fixture (with new ids) until n_items items
+def scaled_fixture(name, n_items):
+    with open(os.path.join(FIXTURES_DIR, f"{name}.xml"), "rb") as f:
+        content = f.read()
+    items = re.findall(rb"<item .*?</item>", content, flags=re.S)
+    head, tail = content[:content.index(items[0])], content[content.rindex(items[-1]) + len(items[-1]):]
+    scaled = []
+    for i in range(n_items):
+        item = items[i % len(items)]
+        scaled.append(re.sub(rb'(objectid|id)="\d+"', lambda m: m.group(1) + b'="%d"' % (i + 1), item, count=1))
+    return head + b"\n".join(scaled) + tail
+
+
+def parse_with_bs4(name, content):
+    from bs4 import BeautifulSoup as bs
+    items = bs(content, "lxml").find_all("item")
+    if name == "collection":
+        return [(i.get("objectid"), i.find("name").text, i.find("status").attrs, i.find("numplays").text)
+                for i in items]
+    if name == "thing":
+        return [(i.get("id"), [(li.get("type"), li.get("id"), li.get("value")) for li in i.find_all("link")],
+                 i.find("description").text, i.find("thumbnail").text) for i in items]
+    return [(i.get("id"), i.find("name").get("value"),
+             i.find("yearpublished").get("value") if i.find("yearpublished") else 'unknown') for i in items]
+
+
+def parse_with_iterparse(name, content):
+    from core import bgg_xml_parser
+    if name == "collection":
+        return list(bgg_xml_parser.iter_collection_items(content))
+    if name == "thing":
+        return list(bgg_xml_parser.iter_thing_items(content, ["description", "thumbnail"]))
+    if name == "hot":
+        return list(bgg_xml_parser.iter_hot_items(content))
+    return list(bgg_xml_parser.iter_search_items(content))
+
+
+def peak_rss_kb():
+    # ru_maxrss is in KB on Linux and in bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 1024 if sys.platform == "darwin" else peak
+
+
+# executed in the child interpreter: it prints "<seconds> <peak rss increase KB> <n records>"
+def run_single(parser, name, n_items):
+    content = scaled_fixture(name, n_items)
+    parse = parse_with_bs4 if parser == "bs4" else parse_with_iterparse
+    # import the parser modules before taking the baseline
+    parse(name, scaled_fixture(name, 1))
+    baseline = peak_rss_kb()
+    start = time.perf_counter()
+    records = parse(name, content)
+    elapsed = time.perf_counter() - start
+    print(elapsed, peak_rss_kb() - baseline, len(records))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--n-items", type=int, default=5000)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--run", nargs=2, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run:
+        run_single(args.run[0], args.run[1], args.n_items)
+        return
+
+    print(f"{'fixture':<12}{'parser':<12}{'MB':>8}{'best time (s)':>16}{'peak RSS (MB)':>16}")
+    for name in FIXTURES:
+        size_mb = len(scaled_fixture(name, args.n_items)) / 1024 / 1024
+        for parser_name in ["bs4", "iterparse"]:
+            times, peaks = [], []
+            for _ in range(args.repeat):
+                output = subprocess.run(
+                    [sys.executable, "-m", "benchmarks.bench_xml_parsing", "--n-items", str(args.n_items),
+                     "--run", parser_name, name],
+                    check=True, capture_output=True, text=True, cwd=ROOT_DIR
+                ).stdout.split()
+                times.append(float(output[0]))
+                peaks.append(float(output[1]) / 1024)
+            print(f"{name:<12}{parser_name:<12}{size_mb:>8.2f}{min(times):>16.3f}{max(peaks):>16.1f}")
+
+
+if __name__ == '__main__':
+    main()
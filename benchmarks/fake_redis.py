@@ -0,0 +1,78 @@
+# Minimal in-memory stand-in of a redis-py client, with the subset of commands used by core.bgg_cache.RedisCacheBackend
+# (get, set with ex/px/nx, mget, delete, scan_iter, pipeline): several RedisCacheBackend sharing the same FakeRedis
+# behave as bot replicas sharing the same Redis server, without a server.
+#
+# usage:
+#   from benchmarks.fake_redis import FakeRedis
+#   from core.bgg_cache import RedisCacheBackend
+#   server = FakeRedis()
+#   replica_1, replica_2 = RedisCacheBackend(server), RedisCacheBackend(server)
+import fnmatch
+import threading
+import time
+
+
+class FakeRedis(object):
+    def __init__(self):
+        self._data = {}  # key -> (bytes, expires_at)
+        self._lock = threading.Lock()
+        self.commands = 0
+
+    @staticmethod
+    def _encode(value):
+        return value if isinstance(value, bytes) else str(value).encode()
+
+    def _alive(self, key):
+        entry = self._data.get(key)
+        if entry is not None and entry[1] is not None and entry[1] <= time.time():
+            del self._data[key]
+            return None
+        return entry
+
+    def get(self, key):
+        with self._lock:
+            self.commands += 1
+            entry = self._alive(key)
+            return entry[0] if entry is not None else None
+
+    def set(self, key, value, ex=None, px=None, nx=False):
+        with self._lock:
+            self.commands += 1
+            if nx and self._alive(key) is not None:
+                return None
+            ttl = ex if ex is not None else (px / 1000 if px is not None else None)
+            self._data[key] = (self._encode(value), time.time() + ttl if ttl is not None else None)
+            return True
+
+    def mget(self, keys):
+        with self._lock:
+            self.commands += 1
+            return [entry[0] if entry is not None else None for entry in map(self._alive, keys)]
+
+    def delete(self, *keys):
+        with self._lock:
+            self.commands += 1
+            return sum(self._data.pop(key, None) is not None for key in keys)
+
+    def scan_iter(self, match="*"):
+        with self._lock:
+            self.commands += 1
+            return [key for key in list(self._data) if fnmatch.fnmatchcase(key, match) and self._alive(key)]
+
+    def pipeline(self):
+        return _FakePipeline(self)
+
+
+class _FakePipeline(object):
+    def __init__(self, client):
+        self.client = client
+        self._commands = []
+
+    def set(self, *args, **kwargs):
+        self._commands.append((self.client.set, args, kwargs))
+        return self
+
+    def execute(self):
+        results = [command(*args, **kwargs) for command, args, kwargs in self._commands]
+        self._commands = []
+        return results
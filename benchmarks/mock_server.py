@@ -0,0 +1,170 @@
+# Local stand-in for the BGG XML API (xmlapi2), for the benchmarks and for running the bot offline:
+# - /hot: the synthetic hotness list
+# - /thing?id=...: the recorded fixture items if available, synthetic items otherwise
+# - /collection?username=...: 'fixture' replays the recorded collection, 'user_<n>[_<seed>]' returns a synthetic
+#   collection of n boardgames, any other username answers with the BGG <errors> response
+# - /search?query=...: the recorded search results
+# Each response is delayed by 'latency' seconds and the first 'queued' requests of each collection are answered with
+# 202 (as BGG does while it prepares the collection). The requests are counted by endpoint and status, and the
+# counters are served as JSON by /_stats (not counted itself).
+# fail_next(endpoint, status, times) makes the next 'times' requests of the endpoint fail with the given status (eg:
+# BGG answering 500 or 503), to reproduce the error paths.
+#
+# usage (from the repository root): python -m benchmarks.mock_server [--port 8765] [--latency 0.05] [--queued 1]
+# then start the bot (or anything else) with BGG_API_URL=http://127.0.0.1:8765/xmlapi2
+import argparse
+import collections
+import json
+import os
+import re
+import threading
+import time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+from benchmarks import synthetic
+
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+SYNTHETIC_USERNAME = re.compile(r"user_(\d+)(?:_(\d+))?$")
+
+
+def _read_fixture(name):
+    with open(os.path.join(FIXTURES_DIR, f"{name}.xml"), "rb") as f:
+        return f.read()
+
+
+class MockBggServer(object):
+    def __init__(self, host="127.0.0.1", port=0, latency=0.0, queued=0):
+        self.latency = latency
+        self.queued = queued
+        self.requests = collections.Counter()
+        self._collection_requests = collections.Counter()
+        self._failures = {}  # endpoint -> [status, remaining requests]
+        self._lock = threading.Lock()
+        self._fixture_things = {
+            id_.decode(): item for id_, item in
+            re.findall(rb'<item type="boardgame" id="(\d+)">(.*?</item>)', _read_fixture("thing"), flags=re.S)
+        }
+        self._httpd = ThreadingHTTPServer((host, port), self._handler_class())
+        self._httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}/xmlapi2"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._httpd.serve_forever, name="mock-bgg", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def reset_counters(self):
+        with self._lock:
+            self.requests.clear()
+            self._collection_requests.clear()
+            self._failures.clear()
+
+    def fail_next(self, endpoint, status=500, times=1):
+        with self._lock:
+            self._failures[endpoint] = [status, times]
+
+    def _count(self, endpoint, status):
+        with self._lock:
+            self.requests[(endpoint, status)] += 1
+
+    def respond(self, path):
+        # it returns (endpoint, status, body)
+        url = urlparse(path)
+        endpoint = url.path.rstrip("/").split("/")[-1]
+        query = {k: v[0] for k, v in parse_qs(url.query).items()}
+        if endpoint == "_stats":
+            with self._lock:
+                return endpoint, 200, json.dumps({f"{e}:{s}": n for (e, s), n in self.requests.items()}).encode()
+        with self._lock:
+            failure = self._failures.get(endpoint)
+            if failure is not None and failure[1] > 0:
+                failure[1] -= 1
+                return endpoint, failure[0], b"<html>error</html>"
+        if endpoint == "hot":
+            return endpoint, 200, synthetic.hot_xml()
+        if endpoint == "search":
+            return endpoint, 200, _read_fixture("search")
+        if endpoint == "thing":
+            ids = query.get("id", "").split(",")
+            items = [
+                b'<item type="boardgame" id="' + id_.encode() + b'">' + self._fixture_things[id_]
+                if id_ in self._fixture_things else synthetic.thing_item_xml(id_).encode()
+                for id_ in ids if id_.isdigit()
+            ]
+            return endpoint, 200, b'<?xml version="1.0" encoding="utf-8"?><items>' + b"".join(items) + b'</items>'
+        if endpoint == "collection":
+            username = query.get("username", "")
+            with self._lock:
+                self._collection_requests[path] += 1
+                queued = self._collection_requests[path] <= self.queued
+            if queued:
+                return endpoint, 202, (b'<?xml version="1.0" encoding="utf-8"?><message>Your request for this '
+                                       b'collection has been accepted and will be processed.</message>')
+            if username == "fixture":
+                return endpoint, 200, _read_fixture("collection")
+            match = SYNTHETIC_USERNAME.match(username)
+            if match is None:
+                return endpoint, 200, _read_fixture("collection_errors")
+            n_games, seed = int(match.group(1)), int(match.group(2) or 0)
+            if "modifiedsince" in query:
+                # only a couple of changes since the last refresh
+                return endpoint, 200, synthetic.collection_xml(
+                    2, seed=seed, ids=synthetic.collection_ids(n_games, seed)[:1] + [10**6 + seed]
+                )
+            return endpoint, 200, synthetic.collection_xml(n_games, seed=seed)
+        return endpoint, 404, b""
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"  # keep-alive
+
+            def do_GET(self):
+                endpoint, status, body = server.respond(self.path)
+                if endpoint != "_stats":
+                    if server.latency > 0:
+                        time.sleep(server.latency)
+                    server._count(endpoint, status)
+                self.send_response(status)
+                self.send_header("Content-Type", "text/xml; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format_, *args):
+                pass
+
+        return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--queued", type=int, default=1)
+    args = parser.parse_args()
+
+    server = MockBggServer(host=args.host, port=args.port, latency=args.latency, queued=args.queued).start()
+    print(f"mock BGG API listening on {server.url}")
+    try:
+        while True:
+            time.sleep(60)
+            print(dict(server.requests))
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == '__main__':
+    main()
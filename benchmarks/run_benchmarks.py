@@ -0,0 +1,188 @@
+# Offline benchmark suite: it starts the local stand-in BGG API (benchmarks/mock_server.py) and measures, on synthetic
+# collections of different sizes:
+# - load_hot_boardgames (cold: empty caches and feature store)
+# - load_user_collection, cold and incremental (refresh after the cached collection expiration)
+# - BggSuggestions.suggest_from_user (collection already loaded) and suggest_from_boardgame, with an empty results
+#   cache, and suggest_from_user as a results cache hit ('_cached')
+# - BggSuggestions._get_top_n for each format_
+# Each case runs in a fresh interpreter (so that the peak RSS is its own) and it reports the latency percentiles, the
+# requests sent to the API by each measured run and the peak RSS.
+# --output saves the results as JSON, to track regressions.
+#
+# usage (from the repository root):
+#   python -m benchmarks.run_benchmarks [--sizes 10,100,1000,10000] [--repeat 5] [--latency 0.02] [--queued 0]
+import argparse
+import collections
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from urllib.request import urlopen
+import numpy as np
+from benchmarks.mock_server import MockBggServer
+
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CASES = [
+    "load_hot_boardgames",
+    "load_user_collection_cold",
+    "load_user_collection_incremental",
+    "suggest_from_user",
+    "suggest_from_user_cached",
+    "suggest_from_boardgame",
+    "get_top_n_dict",
+    "get_top_n_dataframe",
+    "get_top_n_markdown"
+]
+# the cases whose cost doesn't depend on the collection size
+SIZE_INDEPENDENT_CASES = ["load_hot_boardgames", "suggest_from_boardgame"]
+FIXTURE_BOARDGAME_ID = 224517
+
+
+def peak_rss_mb():
+    # ru_maxrss is in KB on Linux and in bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 1024 / 1024 if sys.platform == "darwin" else peak / 1024
+
+
+# CHILD SIDE: the core library is imported here, after BGG_API_URL has been set by the parent
+def _reset(bgg_api_manager, store_path=None):
+    from core.bgg_feature_store import FeatureStore
+    bgg_api_manager.cache_backend.clear()
+    bgg_api_manager.collection_snapshots.clear()
+    bgg_api_manager.collection_scheduler._completed.clear()
+    if store_path is not None:
+        bgg_api_manager.feature_store.close()
+        if os.path.exists(store_path):
+            os.remove(store_path)
+        bgg_api_manager.feature_store = FeatureStore(path=store_path)
+
+
+def _mock_stats():
+    with urlopen(os.environ["BGG_API_URL"] + "/_stats") as response:
+        return collections.Counter(json.loads(response.read()))
+
+
+# it runs the function and it returns the elapsed seconds, adding the requests it sent to the requests counter
+def _timed(requests, function, *args, **kwargs):
+    before = _mock_stats()
+    start = time.perf_counter()
+    function(*args, **kwargs)
+    elapsed = time.perf_counter() - start
+    requests.update(_mock_stats() - before)
+    return elapsed
+
+
+def run_case(case, size, repeat, rate, engine):
+    from core import bgg_api_manager
+    from core.bgg_async_client import TokenBucket
+    bgg_api_manager.bgg_client.async_client.rate_limiter = TokenBucket(rate=rate, capacity=max(1, int(rate)))
+    bgg_api_manager.collection_scheduler.base_delay = 0.2
+    store_path = os.path.join(tempfile.mkdtemp(), "feature_store.sqlite")
+    _reset(bgg_api_manager, store_path)
+
+    latencies, requests = [], collections.Counter()
+    if case == "load_hot_boardgames":
+        for _ in range(repeat):
+            _reset(bgg_api_manager, store_path)
+            latencies.append(_timed(requests, bgg_api_manager.load_hot_boardgames))
+    elif case == "load_user_collection_cold":
+        for r in range(repeat):
+            _reset(bgg_api_manager, store_path)
+            latencies.append(_timed(requests, bgg_api_manager.load_user_collection, f"user_{size}_{r}"))
+    elif case == "load_user_collection_incremental":
+        for r in range(repeat):
+            _reset(bgg_api_manager, store_path)
+            bgg_api_manager.load_user_collection(f"user_{size}_{r}")
+            # the cached collection expired
+            bgg_api_manager.cache_backend.clear("collection")
+            bgg_api_manager.collection_scheduler._completed.clear()
+            latencies.append(_timed(requests, bgg_api_manager.load_user_collection, f"user_{size}_{r}"))
+    else:
+        from core.bgg_hotness import hotness_manager
+        from core.bgg_suggestions import BggSuggestions
+        # the hotness list is loaded from the stand-in server, never from a persisted snapshot
+        hotness_manager.path = None
+        bgg_suggestions = BggSuggestions(engine=engine)
+        username = f"user_{size}"
+        bgg_api_manager.load_user_collection(username, filters=bgg_suggestions.filters)
+        # the results cache is cleared before each run (but for the '_cached' cases): the ranking is measured
+        if case in ["suggest_from_user", "suggest_from_user_cached"]:
+            bgg_suggestions.suggest_from_user(username)
+            for _ in range(repeat):
+                if case == "suggest_from_user":
+                    bgg_suggestions.results_cache.clear()
+                latencies.append(_timed(requests, bgg_suggestions.suggest_from_user, username))
+        elif case == "suggest_from_boardgame":
+            bgg_suggestions.suggest_from_boardgame(FIXTURE_BOARDGAME_ID)
+            for _ in range(repeat):
+                bgg_suggestions.results_cache.clear()
+                latencies.append(_timed(requests, bgg_suggestions.suggest_from_boardgame, FIXTURE_BOARDGAME_ID))
+        else:
+            ranked_df = bgg_suggestions._get_ranked(bgg_api_manager.load_user_collection(username))
+            format_ = case[len("get_top_n_"):]
+            for _ in range(repeat):
+                latencies.append(_timed(requests, BggSuggestions._get_top_n, ranked_df, format_=format_))
+    return {"latencies": latencies, "requests": dict(requests), "peak_rss_mb": peak_rss_mb()}
+
+
+# PARENT SIDE
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", default="10,100,1000,10000")
+    parser.add_argument("--cases", default=",".join(CASES))
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--latency", type=float, default=0.02, help="seconds added to each mock API response")
+    parser.add_argument("--queued", type=int, default=0, help="202 responses before each collection is ready")
+    parser.add_argument("--rate", type=float, default=100, help="client rate limit (requests per second)")
+    parser.add_argument("--engine", default="vectorized")
+    parser.add_argument("--output", help="JSON file where the results are saved")
+    parser.add_argument("--run-case", help=argparse.SUPPRESS)
+    parser.add_argument("--size", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_case:
+        print(json.dumps(run_case(args.run_case, args.size, args.repeat, args.rate, args.engine)))
+        return
+
+    server = MockBggServer(latency=args.latency, queued=args.queued).start()
+    sizes = [int(s) for s in args.sizes.split(",")]
+    results = []
+    print(f"{'case':<36}{'size':>7}{'p50 ms':>10}{'p95 ms':>10}{'max ms':>10}{'peak RSS MB':>13}   requests/run")
+    try:
+        for case in args.cases.split(","):
+            for size in (sizes[:1] if case in SIZE_INDEPENDENT_CASES else sizes):
+                output = subprocess.run(
+                    [sys.executable, "-m", "benchmarks.run_benchmarks", "--run-case", case, "--size", str(size),
+                     "--repeat", str(args.repeat), "--rate", str(args.rate), "--engine", args.engine],
+                    check=True, capture_output=True, text=True, cwd=ROOT_DIR,
+                    env={**os.environ, "BGG_API_URL": server.url}
+                ).stdout
+                result = json.loads(output.strip().splitlines()[-1])
+                latencies_ms = np.array(result["latencies"]) * 1000
+                requests = {k: round(n / args.repeat, 1) for k, n in sorted(result["requests"].items())}
+                results.append({
+                    "case": case, "size": size,
+                    "p50_ms": float(np.percentile(latencies_ms, 50)),
+                    "p95_ms": float(np.percentile(latencies_ms, 95)),
+                    "max_ms": float(latencies_ms.max()),
+                    "requests_per_run": requests,
+                    "peak_rss_mb": result["peak_rss_mb"]
+                })
+                r = results[-1]
+                requests_text = " ".join(f"{k}={v:g}" for k, v in requests.items())
+                print(f"{case:<36}{size:>7}{r['p50_ms']:>10.1f}{r['p95_ms']:>10.1f}{r['max_ms']:>10.1f}"
+                      f"{r['peak_rss_mb']:>13.1f}   {requests_text or '-'}")
+    finally:
+        server.stop()
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"args": vars(args), "results": results}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,86 @@
+# Synthetic (but BGG-shaped) XML responses, deterministic for a given seed/id:
+# - hot_xml: the hotness list (50 boardgames by default)
+# - thing_xml: /thing items with name, description, thumbnail and 8-20 links among a realistic number of categories,
+#   mechanics, families and designers
+# - collection_xml: a collection of 10 to 10,000 (or more) boardgames with statuses and numplays
+import random
+from xml.sax.saxutils import quoteattr, escape
+
+
+N_CATEGORIES = 84
+N_MECHANICS = 190
+N_FAMILIES = 3000
+N_DESIGNERS = 2000
+HOT_IDS_OFFSET = 900000  # the hot boardgames ids don't overlap with the collections ones
+STATUSES = ["own", "prevowned", "fortrade", "want", "wanttoplay", "wanttobuy", "wishlist", "preordered"]
+
+
+def _links(rng):
+    links = [("boardgamecategory", rng.randrange(N_CATEGORIES), "Category") for _ in range(rng.randint(1, 4))]
+    links += [("boardgamemechanic", rng.randrange(N_MECHANICS), "Mechanic") for _ in range(rng.randint(2, 8))]
+    # the families follow a long tail distribution, as the real ones
+    links += [("boardgamefamily", int(rng.paretovariate(1.2) * 10) % N_FAMILIES, "Family")
+              for _ in range(rng.randint(1, 6))]
+    links += [("boardgamedesigner", rng.randrange(N_DESIGNERS), "Designer") for _ in range(rng.randint(1, 2))]
+    return [(t, i, f"{label} {i}") for t, i, label in dict.fromkeys(links)]
+
+
+def thing_item_xml(id_):
+    rng = random.Random(int(id_))
+    links = "".join(
+        f'<link type="{t}" id="{i}" value={quoteattr(v)}/>' for t, i, v in _links(rng)
+    )
+    return (
+        f'<item type="boardgame" id="{id_}">'
+        f'<thumbnail>https://cf.geekdo-images.com/synthetic/thumb/{id_}.jpg</thumbnail>'
+        f'<image>https://cf.geekdo-images.com/synthetic/original/{id_}.jpg</image>'
+        f'<name type="primary" sortindex="1" value="Boardgame {id_}"/>'
+        f'<description>{escape("Synthetic description of boardgame " + str(id_) + ". " * rng.randint(5, 50))}'
+        f'</description>'
+        f'<yearpublished value="{rng.randint(1990, 2026)}"/>'
+        f'{links}'
+        f'</item>'
+    )
+
+
+def thing_xml(ids):
+    return ('<?xml version="1.0" encoding="utf-8"?><items>'
+            + "".join(thing_item_xml(id_) for id_ in ids) + '</items>').encode()
+
+
+def hot_ids(n_items=50):
+    return [HOT_IDS_OFFSET + i for i in range(n_items)]
+
+
+def hot_xml(n_items=50):
+    return ('<?xml version="1.0" encoding="utf-8"?><items>' + "".join(
+        f'<item id="{id_}" rank="{rank}">'
+        f'<thumbnail value="https://cf.geekdo-images.com/synthetic/thumb/{id_}.jpg"/>'
+        f'<name value="Boardgame {id_}"/><yearpublished value="2026"/>'
+        f'</item>' for rank, id_ in enumerate(hot_ids(n_items), start=1)
+    ) + '</items>').encode()
+
+
+def collection_ids(n_games, seed=0):
+    # the collections of different users overlap, as the real ones do
+    rng = random.Random(seed)
+    return rng.sample(range(1, max(n_games * 3, 1000)), n_games)
+
+
+def collection_xml(n_games, seed=0, ids=None):
+    rng = random.Random(seed)
+    items = []
+    for n, id_ in enumerate(ids if ids is not None else collection_ids(n_games, seed)):
+        status = {s: int(rng.random() < 0.2) for s in STATUSES}
+        status["own"] = int(rng.random() < 0.7)
+        items.append(
+            f'<item objecttype="thing" objectid="{id_}" subtype="boardgame" collid="{seed * 100000 + n}">'
+            f'<name sortindex="1">Boardgame {id_}</name>'
+            f'<yearpublished>{rng.randint(1990, 2026)}</yearpublished>'
+            f'<status {" ".join(f"{k}={quoteattr(str(v))}" for k, v in status.items())} '
+            f'lastmodified="2026-01-01 00:00:00"/>'
+            f'<numplays>{int(rng.expovariate(0.3))}</numplays>'
+            f'</item>'
+        )
+    return (f'<?xml version="1.0" encoding="utf-8" standalone="yes"?><items totalitems="{len(items)}">'
+            + "".join(items) + '</items>').encode()
@@ -0,0 +1,317 @@
+import numpy as np
+from scipy import sparse
+
+
+AFFINITY_MODES = ['max', 'sum_weighted']
+MAX_LIKED_CHUNK = 256  # liked boardgames scored together by AffinityAccumulator in 'max' mode
+RANKED_COLUMNS = ["id_hot", "name_hot", "thumbnail", "description", "total_affinity", "because_you_also_like"]
+
+
+# it interns the feature values (eg: 'Economic', 'Worker Placement'...) into consecutive integer ids, that are the
+# columns of the sparse feature matrices
+# once frozen (eg: when it belongs to a hotness snapshot shared among threads) no new value can be added
+class FeatureVocabulary(object):
+    def __init__(self):
+        self._ids = {}
+        self.frozen = False
+
+    def intern(self, value):
+        id_ = self._ids.get(value)
+        if id_ is None:
+            if self.frozen:
+                raise AttributeError(f"vocabulary is frozen, can't add value '{value}'")
+            id_ = self._ids[value] = len(self._ids)
+        return id_
+
+    def freeze(self):
+        self.frozen = True
+        return self
+
+    def get(self, value, default=None):
+        return self._ids.get(value, default)
+
+    def __len__(self):
+        return len(self._ids)
+
+
+# it encodes each list of features as a row of a CSR matrix (n_games x len(vocabulary)):
+# - grow=True adds the unknown values to the vocabulary, grow=False ignores them
+# - binary=False counts how many times a value appears in the features, binary=True only marks its presence
+def encode_features(features_lists, vocabulary, grow=True, binary=False):
+    indptr, indices = [0], []
+    for features in features_lists:
+        for feature in features:
+            id_ = vocabulary.intern(feature.value) if grow else vocabulary.get(feature.value)
+            if id_ is not None:
+                indices.append(id_)
+        indptr.append(len(indices))
+    matrix = sparse.csr_matrix(
+        (np.ones(len(indices), dtype=np.int32), np.array(indices, dtype=np.int64), np.array(indptr, dtype=np.int64)),
+        shape=(len(features_lists), len(vocabulary))
+    )
+    matrix.sum_duplicates()
+    if binary:
+        matrix.data[:] = 1
+    return matrix
+
+
+# CORE (vectorized version of BggSuggestions.calculate_affinity + BggSuggestions.affinity_handler)
+# the affinity of a couple hot boardgame - liked boardgame is the number of features of the hot boardgame whose value
+# is also among the liked boardgame ones, divided by the number of features of the hot boardgame. So, encoding the hot
+# boardgames as feature counts (H) and the liked ones as feature presence (L), the whole affinity matrix is
+# (H @ L.T) / n_features_hot
+# H, n_features_hot and the vocabulary only depend on the hotness: they are precomputed in the HotnessSnapshot
+def affinity_matrix(hotness_snapshot, liked_features):
+    # the liked values missing in the hot vocabulary can't be in common with any hot boardgame: ignore them
+    liked_matrix = encode_features(liked_features, hotness_snapshot.vocabulary, grow=False, binary=True)
+    n_features = hotness_snapshot.n_features
+    common = (hotness_snapshot.matrix @ liked_matrix.T).toarray().astype(float)
+    return np.divide(common, n_features[:, None], out=np.zeros_like(common), where=n_features[:, None] > 0)
+
+
+def _common_features(hot_features, liked_values):
+    return [f.value for f in hot_features if f.value in liked_values]
+
+
+def _liked_weights(liked_boardgames, mode):
+    if mode == 'max':
+        return np.ones(len(liked_boardgames))
+    return np.array([g.numplays for g in liked_boardgames], dtype=float) + 0.5
+
+
+# same affinity of affinity_matrix, accumulated liked boardgame batch by liked boardgame batch over a (possibly large)
+# set of candidate boardgames, visiting only the candidates sharing at least one feature with the liked boardgames:
+# - matrix: CSR (n_candidates x len(vocabulary)) feature counts of the candidates, n_features its row sums
+# - postings: the same matrix as CSC, each column is the posting list (candidates and counts) of a feature value
+# after each add(), total holds the running total_affinity of each candidate (sum of the weighted affinities or max of
+# the raw ones, according to the mode) and touched marks the candidates with at least one feature in common
+class AffinityAccumulator(object):
+    def __init__(self, matrix, n_features, vocabulary, mode='sum_weighted', postings=None):
+        if mode not in AFFINITY_MODES:
+            raise AttributeError(f"mode '{mode}' not in allowed ones: {AFFINITY_MODES}")
+        self.matrix = matrix
+        self.postings = postings if postings is not None else matrix.tocsc()
+        self.n_features = n_features
+        self.vocabulary = vocabulary
+        self.mode = mode
+        self.total = np.zeros(matrix.shape[0])
+        self.touched = np.zeros(matrix.shape[0], dtype=bool)
+        self.liked_boardgames = []
+        self.postings_visited = 0
+        self._liked_matrices = []
+
+    def add(self, liked_boardgames):
+        liked_boardgames = list(liked_boardgames)
+        if len(liked_boardgames) == 0:
+            return self
+        self.liked_boardgames.extend(liked_boardgames)
+        liked_matrix = encode_features(
+            [g.features for g in liked_boardgames], self.vocabulary, grow=False, binary=True
+        )
+        self._liked_matrices.append(liked_matrix)
+        features = np.unique(liked_matrix.indices)
+        if len(features) == 0:
+            return self
+        # only the posting lists of the liked feature values are visited
+        postings = self.postings[:, features]
+        liked_matrix = liked_matrix[:, features]
+        self.postings_visited += postings.nnz
+        n_features = self.n_features
+        if self.mode == 'sum_weighted':
+            # sum_j w_j * common_ij / n_i = (postings @ (L.T @ w))_i / n_i: no candidate x liked pairs needed
+            query = liked_matrix.T @ _liked_weights(liked_boardgames, self.mode)
+            common = np.asarray(postings @ query, dtype=float).ravel()
+            self.total += np.divide(common, n_features, out=np.zeros_like(common), where=n_features > 0)
+        else:
+            # max_j common_ij / n_i: the pairs are needed, but only the ones sharing features (sparse product, in
+            # chunks of liked boardgames to bound the memory)
+            common = np.zeros(self.total.shape[0])
+            for start in range(0, liked_matrix.shape[0], MAX_LIKED_CHUNK):
+                chunk_common = (postings @ liked_matrix[start:start + MAX_LIKED_CHUNK].T).tocsr().max(axis=1)
+                common = np.maximum(common, np.asarray(chunk_common.toarray(), dtype=float).ravel())
+            self.total = np.maximum(
+                self.total, np.divide(common, n_features, out=np.zeros_like(common), where=n_features > 0)
+            )
+        self.touched |= common > 0
+        return self
+
+    # the candidates with at least one feature in common with the liked boardgames
+    def candidates(self):
+        return np.flatnonzero(self.touched)
+
+    # because_you_also_like of the given candidates (rows): the first_n liked boardgames by score, each as
+    # (name, common features, score), as in rank_vectorized
+    def reasons(self, rows, candidates_features, first_n=None):
+        if first_n is None:
+            first_n = 1 if self.mode == 'max' else 3
+        if len(rows) == 0 or len(self.liked_boardgames) == 0:
+            return [[] for _ in rows]
+        liked_matrix = sparse.vstack(self._liked_matrices).tocsr()
+        self._liked_matrices = [liked_matrix]
+        n_features = self.n_features[rows][:, None]
+        common = (self.matrix[rows] @ liked_matrix.T).toarray().astype(float)
+        scores = np.divide(common, n_features, out=np.zeros_like(common), where=n_features > 0)
+        scores *= _liked_weights(self.liked_boardgames, self.mode)[None, :]
+        top_liked = np.argsort(-scores, axis=1, kind='stable')[:, :first_n]
+        liked_values = {}
+        because_you_also_like = []
+        for row, liked_indexes in enumerate(top_liked):
+            reasons = []
+            for j in liked_indexes:
+                if j not in liked_values:
+                    liked_values[j] = {f.value for f in self.liked_boardgames[j].features}
+                reasons.append((
+                    self.liked_boardgames[j].name,
+                    _common_features(candidates_features[row], liked_values[j]),
+                    float(scores[row, j])
+                ))
+            because_you_also_like.append(reasons)
+        return because_you_also_like
+
+
+# it returns the same ranked_df of BggSuggestions.affinity_handler (same columns, same values) without building the
+# hot x liked cross join. liked_boardgames is a sequence of Game
+def rank_vectorized(hotness_snapshot, liked_boardgames, mode='sum_weighted'):
+    # pandas is imported at the first ranking, not at startup
+    import pandas as pd
+    if mode not in AFFINITY_MODES:
+        raise AttributeError(f"mode '{mode}' not in allowed ones: {AFFINITY_MODES}")
+    if len(liked_boardgames) == 0:
+        return pd.DataFrame(columns=RANKED_COLUMNS)
+
+    hot_boardgames = hotness_snapshot.boardgames
+    liked_features = [g.features for g in liked_boardgames]
+    liked_names = [g.name for g in liked_boardgames]
+    affinity = affinity_matrix(hotness_snapshot, liked_features)
+
+    # same filters of the pandas version:
+    # - the hot boardgames the user already likes are excluded
+    # - the groupby on "thumbnail" and "description" drops the hot boardgames where any of them is missing
+    liked_names_set = set(liked_names)
+    kept = [
+        i for i, hot_boardgame in enumerate(hot_boardgames)
+        if hotness_snapshot.rankable[i] and hot_boardgame.name not in liked_names_set
+    ]
+    if len(kept) == 0:
+        return pd.DataFrame(columns=RANKED_COLUMNS)
+    affinity = affinity[kept]
+
+    if mode == 'max':
+        # MAX OF THE RAW AFFINITY
+        scores = affinity
+        total_affinity = scores.max(axis=1)
+        first_n = 1
+    else:
+        # SUM OF THE AFFINITY BY NUMPLAYS
+        scores = affinity * (np.array([g.numplays for g in liked_boardgames], dtype=float) + 0.5)[None, :]
+        total_affinity = scores.sum(axis=1)
+        first_n = 3
+
+    # because_you_also_like: the first_n liked boardgames by score (stable, as the sorted() of the pandas version)
+    top_liked = np.argsort(-scores, axis=1, kind='stable')[:, :first_n]
+    liked_values = {}
+    because_you_also_like = []
+    for row, liked_indexes in enumerate(top_liked):
+        hot_features = hot_boardgames[kept[row]].features
+        reasons = []
+        for j in liked_indexes:
+            if j not in liked_values:
+                liked_values[j] = {f.value for f in liked_features[j]}
+            reasons.append((liked_names[j], _common_features(hot_features, liked_values[j]), float(scores[row, j])))
+        because_you_also_like.append(reasons)
+
+    return _ranked_df(hot_boardgames, kept, total_affinity, because_you_also_like)
+
+
+def _ranked_df(hot_boardgames, kept, total_affinity, because_you_also_like):
+    import pandas as pd
+    ranked_df = pd.DataFrame({
+        "id_hot": [hot_boardgames[i].id for i in kept],
+        "name_hot": [hot_boardgames[i].name for i in kept],
+        "thumbnail": [hot_boardgames[i].thumbnail for i in kept],
+        "description": [hot_boardgames[i].description for i in kept],
+        "total_affinity": total_affinity,
+        "because_you_also_like": because_you_also_like
+    })
+
+    # FINAL SORTING (the groupby of the pandas version sorts by id_hot first)
+    return ranked_df.sort_values('id_hot', kind='stable') \
+        .sort_values('total_affinity', ascending=False, kind='stable', ignore_index=True)
+
+
+# incremental rank_vectorized, for liked boardgames arriving in chunks (eg: a large collection whose features are still
+# being fetched): after each add() it holds, for each hot boardgame, the running total_affinity (sum of the weighted
+# affinities or max of the raw ones) and its first_n reasons so far. Only a hot x chunk affinity matrix is computed at a
+# time, so the memory doesn't depend on the collection size
+# ranked() returns the (provisional) ranked_df: the rank_vectorized one once all the liked boardgames have been added
+class StreamingRanking(object):
+    def __init__(self, hotness_snapshot, mode='sum_weighted'):
+        if mode not in AFFINITY_MODES:
+            raise AttributeError(f"mode '{mode}' not in allowed ones: {AFFINITY_MODES}")
+        self.hotness_snapshot = hotness_snapshot
+        self.mode = mode
+        self.first_n = 1 if mode == 'max' else 3
+        n_hot = len(hotness_snapshot.boardgames)
+        self.total = np.zeros(n_hot)
+        # scores (descending, -inf for the empty slots) and liked boardgames (Game) of the reasons so far
+        self.top_scores = np.full((n_hot, self.first_n), -np.inf)
+        self.top_liked = np.empty((n_hot, self.first_n), dtype=object)
+        # hot boardgames the user already likes (excluded, as in rank_vectorized)
+        self.excluded = np.zeros(n_hot, dtype=bool)
+        self._rows_by_name = {}
+        for i, hot_boardgame in enumerate(hotness_snapshot.boardgames):
+            self._rows_by_name.setdefault(hot_boardgame.name, []).append(i)
+        self.n_liked = 0
+
+    def add(self, liked_boardgames):
+        liked_boardgames = list(liked_boardgames)
+        if len(liked_boardgames) == 0:
+            return self
+        self.n_liked += len(liked_boardgames)
+        for liked_boardgame in liked_boardgames:
+            self.excluded[self._rows_by_name.get(liked_boardgame.name, [])] = True
+
+        scores = affinity_matrix(self.hotness_snapshot, [g.features for g in liked_boardgames])
+        if self.mode == 'max':
+            self.total = np.maximum(self.total, scores.max(axis=1))
+        else:
+            scores *= _liked_weights(liked_boardgames, self.mode)[None, :]
+            self.total += scores.sum(axis=1)
+
+        # the reasons so far come first: on ties the stable sort keeps the collection order, as the one of
+        # rank_vectorized over the whole collection
+        chunk_liked = np.empty(len(liked_boardgames), dtype=object)
+        for j, liked_boardgame in enumerate(liked_boardgames):
+            chunk_liked[j] = liked_boardgame
+        all_scores = np.hstack([self.top_scores, scores])
+        all_liked = np.hstack([self.top_liked, np.broadcast_to(chunk_liked, scores.shape)])
+        top = np.argsort(-all_scores, axis=1, kind='stable')[:, :self.first_n]
+        self.top_scores = np.take_along_axis(all_scores, top, axis=1)
+        self.top_liked = np.take_along_axis(all_liked, top, axis=1)
+        return self
+
+    def ranked(self):
+        import pandas as pd
+        hot_boardgames = self.hotness_snapshot.boardgames
+        kept = [
+            i for i in range(len(hot_boardgames)) if self.hotness_snapshot.rankable[i] and not self.excluded[i]
+        ]
+        if self.n_liked == 0 or len(kept) == 0:
+            return pd.DataFrame(columns=RANKED_COLUMNS)
+
+        liked_values = {}
+        because_you_also_like = []
+        for i in kept:
+            reasons = []
+            for liked_boardgame, score in zip(self.top_liked[i], self.top_scores[i]):
+                if score == -np.inf:
+                    continue
+                if id(liked_boardgame) not in liked_values:
+                    liked_values[id(liked_boardgame)] = {f.value for f in liked_boardgame.features}
+                reasons.append((
+                    liked_boardgame.name,
+                    _common_features(hot_boardgames[i].features, liked_values[id(liked_boardgame)]),
+                    float(score)
+                ))
+            because_you_also_like.append(reasons)
+        return _ranked_df(hot_boardgames, kept, self.total[kept], because_you_also_like)
@@ -1,17 +1,40 @@
-from bs4 import BeautifulSoup as bs
-import requests
-from time import sleep
+import hashlib
+import json
 import logging
+import os
+import time
+from typing import NamedTuple
 import cachetools
-from core.bgg_exceptions import BggSuggestionException
+from core.bgg_cache import create_cache_backend
+from core.bgg_exceptions import BggSuggestionException, BggRequestException, BggCollectionQueuedException, \
+    BggApiErrorException
+from core.bgg_feature_store import FeatureStore, FEATURE_STORE_TTL
+from core.bgg_async_client import BggClient
+from core.bgg_collection_scheduler import CollectionFetchScheduler
+from core.bgg_metrics import registry as metrics_registry, count_cache_request, register_cache
+from core.bgg_records import Game, intern_features
+from core.bgg_xml_parser import iter_hot_items, iter_search_items, iter_thing_items, iter_collection_items
 
 
-HOT_BOARDGAME_URL = "https://www.boardgamegeek.com/xmlapi2/hot?type=boardgame"
-BOARDGAME_INFO_URL = "https://www.boardgamegeek.com/xmlapi2/thing?id={id}"
-USER_COLLECTION_URL = "https://www.boardgamegeek.com/xmlapi2/collection?username={username}"
-SEARCH_URL = "https://www.boardgamegeek.com/xmlapi2/search?type=boardgame&query={query}"
+# it can be pointed to a local stand-in server (see benchmarks/mock_server.py) through the BGG_API_URL env variable
+BGG_API_URL = os.environ.get("BGG_API_URL", "https://www.boardgamegeek.com/xmlapi2")
+HOT_BOARDGAME_URL = BGG_API_URL + "/hot?type=boardgame"
+BOARDGAME_INFO_URL = BGG_API_URL + "/thing?id={id}"
+# the same endpoint accepts a comma separated list of ids, e.g. thing?id=13,822,174430
+THING_CHUNK_SIZE = 20  # BGG rejects /thing requests with more than 20 ids
+USER_COLLECTION_URL = BGG_API_URL + "/collection?username={username}"
+SEARCH_URL = BGG_API_URL + "/search?type=boardgame&query={query}"
 # NB: no need to add 'boardgameexpansion' because expansions are included into 'boardgame' type
 
+# additional info always extracted from /thing responses and persisted, together with the features, in the store
+STORED_INFO = ["name", "description", "thumbnail", "yearpublished"]
+
+# a collection is refreshed with only the items modified since the previous refresh (BGG timestamps are not UTC, so
+# a margin is added), but the deleted items are not reported this way: once in a while it is fully reloaded
+COLLECTION_FULL_REFRESH_INTERVAL = 60*60*24  # 1 day
+COLLECTION_MODIFIED_SINCE_MARGIN = 60*60*24  # 1 day
+BGG_DATETIME_FORMAT = "%y-%m-%d %H:%M:%S"
+
 ALLOWED_FILTERS = ["own", "prevowned", "fortrade", "want", "wanttoplay", "wanttobuy", "wishlist", "preordered"]
 
 
@@ -19,163 +42,372 @@ ALLOWED_FILTERS = ["own", "prevowned", "fortrade", "want", "wanttoplay", "wantto
 logging.basicConfig(format='%(asctime)s - %(name)s - %(levelname)s - %(message)s', level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-hotness_ttl_cache = cachetools.TTLCache(ttl=60*60*1, maxsize=1)  # 1 hour
-collection_ttl_cache = cachetools.TTLCache(ttl=60*60*1, maxsize=10)  # 1 hour
+HOTNESS_TTL = 60*60*1  # 1 hour
+COLLECTION_TTL = 60*60*1  # 1 hour
+# liked boardgames loaded (and scored, see BggSuggestions.iter_suggestions_from_user) together by the streaming load
+COLLECTION_STREAM_CHUNK_SIZE = THING_CHUNK_SIZE * 10
+# a single process refreshes the hotness list (the lock expires if it dies), the others wait for it up to
+# HOTNESS_REFRESH_WAIT seconds
+HOTNESS_REFRESH_LOCK_TTL = 5*60  # seconds
+HOTNESS_REFRESH_WAIT = 60  # seconds
+
+# cache of the hotness list ('hotness' namespace) and of the users' collections ('collection'): in-process by default,
+# shared by all the bot replicas with BGG_CACHE_URL=redis://... (then the /thing data fetched by any replica is shared
+# too, in the 'features' namespace, on top of each replica's feature store)
+cache_backend = create_cache_backend(
+    os.environ.get("BGG_CACHE_URL"), maxsizes={"hotness": 2, "collection": 10, "collection_version": 10}
+)
+# last snapshot of each user's collection, it outlives the cached collection to allow the incremental refreshes
+collection_snapshots = cachetools.LRUCache(maxsize=1000)
+# persistent per-boardgame store shared by hotness and all the users' collections (it survives restarts)
+feature_store = FeatureStore()
+# pooled, rate limited and concurrent BGG client (sync facade of the asyncio one) shared by all the loaders
+bgg_client = BggClient()
+# collections fetches: non-blocking retries of the 202 (queued) responses and coalescing of the same username requests
+collection_scheduler = CollectionFetchScheduler(bgg_client, USER_COLLECTION_URL)
+
+for _cache in ["hotness", "collection", "feature_store"]:
+    register_cache(_cache)
+metrics_registry.gauge("bgg_feature_store_entries", lambda: len(feature_store))
+metrics_registry.gauge("bgg_collection_fetches_in_flight", lambda: collection_scheduler.metrics()["in_flight"])
+
 
+# simple function for requests execution, it returns the raw (XML) content of the response
+def get_content_from_url(url, raise_exception=True):
+    return get_contents_from_urls([url], raise_exception=raise_exception)[0]
 
-# simple function for requests execution and BeautifulSoup content conversion
-def get_bs_content_from_url(url, raise_exception=True):
+
+# same as get_content_from_url but the requests are executed concurrently (bounded and rate limited by bgg_client)
+def get_contents_from_urls(urls, raise_exception=True):
     try:
-        url_response = requests.get(url)
-        url_bs_content = bs(url_response.content, "lxml")
-        return url_bs_content
-    except requests.exceptions.RequestException as e:
+        return [url_response.content for url_response in bgg_client.get_many(urls)]
+    except BggRequestException as e:
         logging.exception("request failed")
         if raise_exception:
             raise BggSuggestionException("😞💔 We have some issues trying to retrieve BGG's information."
                                          "Try again later or contact the administrator")
+        return [None for _ in urls]
+
+
+def _record_to_result(record, additional_info):
+    features = intern_features(record["features"])
+    if len(additional_info) == 0:
+        return features
+    return (features, *[record.get(a) for a in additional_info])
+
+
+# bulk version of get_boardgame_features: given a list of ids, it fetches them in chunks of chunk_size ids per
+# request and returns a dict {id: features} (or {id: (features, *additional_info)} if additional_info is not empty)
+# where features is a tuple of (interned) Feature
+# the feature_store is read through: only the ids not (or no longer) in the store are requested to BGG
+# NB: ids not found on BGG are simply missing from the returned dict
+def get_boardgames_features(ids, additional_info=None, chunk_size=THING_CHUNK_SIZE, use_store=True):
+    if additional_info is None:
+        additional_info = []
+    if chunk_size < 1:
+        raise AttributeError(f"chunk_size must be a positive integer, got {chunk_size}")
+    # remove duplicates keeping the original order
+    ids = list(dict.fromkeys(str(id_) for id_ in ids))
+    # only the STORED_INFO can be served by the store, any other additional info requires a fresh request
+    use_store = use_store and set(additional_info) <= set(STORED_INFO)
+
+    records = feature_store.get_many(ids) if use_store else {}
+    missing_ids = [id_ for id_ in ids if id_ not in records]
+    if use_store and cache_backend.shared and len(missing_ids) > 0:
+        # the boardgames already fetched by the other replicas
+        shared_records = cache_backend.get_many("features", missing_ids)
+        if len(shared_records) > 0:
+            feature_store.put_many(shared_records)
+            records.update(shared_records)
+            missing_ids = [id_ for id_ in missing_ids if id_ not in shared_records]
+    fetched_records = {}
+    chunks = [missing_ids[start:start + chunk_size] for start in range(0, len(missing_ids), chunk_size)]
+    if use_store:
+        count_cache_request("feature_store", hit=True, n=len(records))
+        count_cache_request("feature_store", hit=False, n=len(missing_ids))
+    # the chunks are requested concurrently
+    with metrics_registry.timer(stage="fetch_features"):
+        boardgames_info_responses_content = get_contents_from_urls(
+            [BOARDGAME_INFO_URL.format(id=",".join(chunk)) for chunk in chunks]
+        )
+    try:
+        with metrics_registry.timer(stage="parse_features"):
+            for boardgames_info_response_content in boardgames_info_responses_content:
+                for id_, record in iter_thing_items(boardgames_info_response_content, STORED_INFO + additional_info):
+                    fetched_records[id_] = record
+    except BggApiErrorException:
+        logging.exception("BGG answered with errors")
+        raise BggSuggestionException("😞💔 We have some issues trying to retrieve BGG's information."
+                                     "Try again later or contact the administrator")
+    if len(fetched_records) > 0:
+        stored_records = {
+            id_: {k: record[k] for k in ["features"] + STORED_INFO} for id_, record in fetched_records.items()
+        }
+        feature_store.put_many(stored_records)
+        if cache_backend.shared:
+            cache_backend.set_many("features", stored_records, ttl=FEATURE_STORE_TTL)
+    records.update(fetched_records)
+
+    return {id_: _record_to_result(records[id_], additional_info) for id_ in ids if id_ in records}
 
 
 # simple function that, given an id, it returns its features (boardgamecategory, boardgamemechanic...)
 def get_boardgame_features(id_, additional_info=None):
     if additional_info is None:
         additional_info = []
-    features = []
-    boardgame_info_response_bs_content = get_bs_content_from_url(BOARDGAME_INFO_URL.format(id=id_))
-    links = boardgame_info_response_bs_content.find_all("link")
-    for link in links:
-        features.append(
-            {
-                "type": link.get("type"),
-                "id": link.get("id"),
-                "value": link.get("value")
-            }
-        )
+    boardgames_features = get_boardgames_features([id_], additional_info=additional_info)
+    if str(id_) in boardgames_features:
+        return boardgames_features[str(id_)]
+    # not found: same shape as a found boardgame without features and additional info
     if len(additional_info) == 0:
-        return features
-    else:
-        addition_info_array = []
-        for a in additional_info:
-            info = boardgame_info_response_bs_content.find(a)
-            if info is not None:
-                addition_info_array.append(info.text or info.get("value"))
-            else:
-                addition_info_array.append(None)
-        return features, *addition_info_array
+        return ()
+    return ((), *[None for _ in additional_info])
 
 
 def search_boardgame(boardgame_name, raise_if_empty=True):
-    search_results_bs_content = get_bs_content_from_url(SEARCH_URL.format(query=boardgame_name))
-    items = search_results_bs_content.find_all("item")
-    results = [
-        {
-            'id': i.get("id"),
-            'name': i.find("name").get("value"),
-            'year': i.find("yearpublished").get("value") if i.find("yearpublished") else 'unknown'
-        } for i in items
-    ]
+    search_results_content = get_content_from_url(SEARCH_URL.format(query=boardgame_name))
+    try:
+        results = list(iter_search_items(search_results_content))
+    except BggApiErrorException:
+        logging.exception("BGG answered with errors")
+        results = []
     if raise_if_empty and len(results) == 0:
         raise BggSuggestionException("Empty results, try another string")
     return results
 
 
-def load_hot_boardgames():
-    # TODO: avoid to update the hotness list if the new one is empty and the old one is not
-    hot_boardgames = hotness_ttl_cache.get('hot_boardgames', [])
-
-    if len(hot_boardgames) == 0:
-        logger.info("updating hot_boardgames cache")
-        hot_boardgames_bs_content = get_bs_content_from_url(HOT_BOARDGAME_URL, raise_exception=False)
-        if hot_boardgames_bs_content is None:
-            return []
-        items = hot_boardgames_bs_content.find_all("item")
-        for item in items:
-            features, description, thumbnail = get_boardgame_features(
-                item.get("id"),
-                additional_info=['description', 'thumbnail']
-            )
-            hot_boardgames.append(
-                {
-                    "id": item.get("id"),
-                    "rank": item.get("id"),
-                    "name": item.find("name").get("value"),
-                    "features": features,
-                    "description": description,
-                    "thumbnail": thumbnail
-                }
+def _fetch_hot_boardgames():
+    logger.info("updating hot_boardgames cache")
+    hot_boardgames = []
+    with metrics_registry.timer(stage="fetch_hot"):
+        hot_boardgames_content = get_content_from_url(HOT_BOARDGAME_URL, raise_exception=False)
+    if hot_boardgames_content is None:
+        return []
+    try:
+        with metrics_registry.timer(stage="parse_hot"):
+            items = list(iter_hot_items(hot_boardgames_content))
+    except BggApiErrorException:
+        logging.exception("BGG answered with errors")
+        return []
+    hot_boardgames_features = get_boardgames_features(
+        [item["id"] for item in items],
+        additional_info=['description', 'thumbnail']
+    )
+    for item in items:
+        features, description, thumbnail = hot_boardgames_features.get(item["id"], ((), None, None))
+        hot_boardgames.append(
+            Game(
+                id=item["id"],
+                rank=item["rank"],
+                name=item["name"],
+                features=features,
+                description=description,
+                thumbnail=thumbnail
             )
-
-        hotness_ttl_cache['hot_boardgames'] = hot_boardgames
+        )
     return hot_boardgames
 
 
-def check_hotness():
-    hotness = load_hot_boardgames()
-    if len(hotness) == 0:
-        logger.error("HOTNESS LIST IS EMPTY")
-        raise BggSuggestionException("😞💔 We had issues trying to get the hotness list from BGG. "
-                                     "Try again later or contact the administrator")
+# NB: an empty list (BGG failures) is never cached, and the HotnessManager never swaps it in
+def load_hot_boardgames():
+    hot_boardgames = cache_backend.get("hotness", "hot_boardgames")
+    count_cache_request("hotness", hit=hot_boardgames is not None)
+    if hot_boardgames is not None:
+        return hot_boardgames
 
+    # only one process (eg: one of the bot replicas sharing the cache) refreshes the hotness list
+    with cache_backend.lock("hotness_refresh", ttl=HOTNESS_REFRESH_LOCK_TTL) as acquired:
+        if acquired:
+            hot_boardgames = _fetch_hot_boardgames()
+            if len(hot_boardgames) > 0:
+                cache_backend.set("hotness", "fetched_at", time.time(), ttl=HOTNESS_TTL)
+                cache_backend.set("hotness", "hot_boardgames", hot_boardgames, ttl=HOTNESS_TTL)
+            return hot_boardgames
 
-def item_to_dict(id_, name, features, numplays):
-    return {
-        "id": id_,
-        "name": name,
-        "features": features,
-        "numplays": numplays
-    }
+    # the others wait for its result (an empty list if it doesn't come in time)
+    logger.info("hotness list being refreshed by another process, waiting for it")
+    deadline = time.monotonic() + HOTNESS_REFRESH_WAIT
+    while time.monotonic() < deadline:
+        time.sleep(0.5)
+        hot_boardgames = cache_backend.get("hotness", "hot_boardgames")
+        if hot_boardgames is not None:
+            return hot_boardgames
+    return []
 
 
-def load_user_collection(username, filters=None):
-    # Please note that for the first request, you only get a "got it, retry later" response
-    # so if this is the case, retry again after 5s
-    # since the user collection is pretty static during the day, add the result into a TTL cache
-    # of five elements and 12h of life
+# when the cached hotness list was fetched from BGG (None if not cached)
+def hot_boardgames_fetched_at():
+    return cache_backend.get("hotness", "fetched_at")
+
+
+def item_to_game(id_, name, features, numplays):
+    return Game(id=str(id_), name=name, features=intern_features(features), numplays=numplays)
+
+
+# it converts a failed collection fetch into the BggSuggestionException to show to the user
+def collection_fetch_exception(username, exception):
+    if isinstance(exception, BggCollectionQueuedException):
+        return BggSuggestionException(f"📜⌛ BGG is still preparing the collection of '{username}', "
+                                      f"try again in a few minutes")
+    logger.error(f"request failed: {exception!r}")
+    return BggSuggestionException("😞💔 We have some issues trying to retrieve BGG's information."
+                                  "Try again later or contact the administrator")
+
+
+# last known state of a user's collection:
+# - items: collection entries {"id", "collid", "name", "numplays", "status"} by collid
+# - features: features of the boardgames already loaded, by boardgame id
+# - fetched_at / full_fetched_at: time of the last refresh / of the last full refresh
+# - version: it increases each time the refresh changes the items
+class CollectionSnapshot(NamedTuple):
+    items: dict
+    features: dict
+    fetched_at: float
+    full_fetched_at: float
+    version: int
+
+
+def collection_key(username):
+    # BGG usernames are case insensitive
+    return username.strip().lower()
+
+
+# the modifiedsince for the next refresh of the user's collection, None when a full refresh is needed
+def _modified_since(username):
+    snapshot = collection_snapshots.get(collection_key(username))
+    if snapshot is None or time.time() - snapshot.full_fetched_at > COLLECTION_FULL_REFRESH_INTERVAL:
+        return None
+    return time.strftime(BGG_DATETIME_FORMAT, time.gmtime(snapshot.fetched_at - COLLECTION_MODIFIED_SINCE_MARGIN))
+
+
+# it starts (without waiting for it) the fetch that the next refresh_user_collection will use
+def submit_collection_fetch(username):
+    return collection_scheduler.submit(username, modifiedsince=_modified_since(username))
+
+
+def is_collection_cached(username):
+    return cache_backend.contains("collection", username)
+
+
+# the version of the cached collection, None if not cached: it is stored in the cache backend together with the
+# collection, so all the replicas sharing it agree on it (the snapshots, and their version, are per process)
+def get_collection_version(username):
+    return cache_backend.get("collection_version", username)
+
+
+# content based: the same collection has the same version in every process
+def liked_boardgames_version(liked_boardgames):
+    content = [(g.id, g.name, g.numplays, len(g.features)) for g in liked_boardgames]
+    return hashlib.sha1(json.dumps(content).encode()).hexdigest()
+
+
+# it refreshes the snapshot of the user's collection: the first time (and every COLLECTION_FULL_REFRESH_INTERVAL) the
+# whole collection is loaded, otherwise only the items modified since the previous refresh are requested and merged
+def refresh_user_collection(username):
+    key = collection_key(username)
+    previous = collection_snapshots.get(key)
+    modifiedsince = _modified_since(username)
+    fetched_at = time.time()
+    try:
+        # it includes the time spent waiting for BGG to prepare the collection (202 responses)
+        with metrics_registry.timer(stage="fetch_collection"):
+            collection_response = collection_scheduler.fetch_sync(username, modifiedsince=modifiedsince)
+    except BggRequestException as e:
+        raise collection_fetch_exception(username, e)
+    try:
+        with metrics_registry.timer(stage="parse_collection"):
+            fetched_items = {i["collid"] or i["id"]: i for i in iter_collection_items(collection_response.content)}
+    except BggApiErrorException:
+        raise BggSuggestionException(f"👤⛔ Username '{username}' not found")
+
+    if modifiedsince is None:
+        items = fetched_items
+        # features never change: keep the ones already loaded for the boardgames still in the collection (the
+        # boardgames without features, eg: not found on BGG, are asked again)
+        ids = {i["id"] for i in items.values()}
+        features = {
+            id_: f for id_, f in previous.features.items() if id_ in ids and len(f) > 0
+        } if previous is not None else {}
+        full_fetched_at = fetched_at
+    else:
+        items = dict(previous.items)
+        items.update(fetched_items)
+        features = previous.features
+        full_fetched_at = previous.full_fetched_at
+    logger.info(f"{'incremental' if modifiedsince else 'full'} refresh of the collection of '{username}': "
+                f"{len(fetched_items)} items fetched")
+
+    if previous is None:
+        version = 1
+    else:
+        version = previous.version + 1 if items != previous.items else previous.version
+    snapshot = CollectionSnapshot(items, features, fetched_at, full_fetched_at, version)
+    collection_snapshots[key] = snapshot
+    return snapshot
+
+
+# streaming version of load_user_collection: it yields the liked boardgames (Game) in chunks of chunk_size, in the
+# collection order, each chunk as soon as its features are loaded (None: a single chunk, all the /thing requests sent
+# together). The whole collection is added to the cache backend once the last chunk has been loaded
+def iter_user_collection(username, filters=None, chunk_size=COLLECTION_STREAM_CHUNK_SIZE):
+    # Please note that for the first request, you only get a "got it, retry later" (202) response:
+    # the collection_scheduler retries it with an exponential backoff until the collection is ready
+    # since the user collection is pretty static during the day, add the result into the cache backend
+    # ('collection' namespace) for COLLECTION_TTL seconds
+    # when it expires, only the changes since the last refresh are requested (see refresh_user_collection)
     if filters is None:
         filters = ["own", "prevowned", "fortrade", "want", "wanttoplay", "wanttobuy", "wishlist", "preordered"]
     if set(filters) - set(ALLOWED_FILTERS):  # A - B
         raise AttributeError(f"unexpected filter {list(set(filters) - set(ALLOWED_FILTERS))}")
-    liked_boardgames = collection_ttl_cache.get(username, [])
-
-    if len(liked_boardgames) == 0:
-        logger.info("updating users collections")
-        collection_bs_content = get_bs_content_from_url(USER_COLLECTION_URL.format(username=username))
-        if collection_bs_content.find("errors"):
-            raise BggSuggestionException(f"👤⛔ Username '{username}' not found")
-        liked_items = collection_bs_content.find_all("item")
-        if len(liked_items) == 0:
-            sleep(5)
-            collection_bs_content = get_bs_content_from_url(USER_COLLECTION_URL.format(username=username))
-            liked_items = collection_bs_content.find_all("item")
-
-        # for each boardgame in collection, get the same features we got above for the hottest
-        logger.info(f"found {len(liked_items)} liked boardgames, processing...")
-        for liked_item in liked_items:
-            status = liked_item.find('status')
-            # logger.info(status)
-            to_include = sum([int(status.get(f)) for f in filters])
-            if to_include > 0:
-                liked_boardgames.append(
-                    item_to_dict(
-                        id_=liked_item.get("objectid"),
-                        name=liked_item.find("name").text,
-                        features=get_boardgame_features(liked_item.get("objectid")),
-                        numplays=int(liked_item.find("numplays").text)
-                    )
-                )
-
-            else:
-                pass
-                # logger.info(f"EXCLUDING {liked_item.find('name').text}")
-        collection_ttl_cache[username] = liked_boardgames
-
-    # if the number of liked boardgames is empty makes no sense to continue but this can be caused by:
-    # - the user doesn't have any boardgame in their collection, try with another username you know it has a
-    # not-empty collection
-    # - the user has a big collection, try again later because it may take a while to get it in this 2-steps process
-    if len(liked_boardgames) == 0:
-        raise BggSuggestionException(f"""📜⛔ No liked boardgame for user '{username}'. This can be caused by:
-- no boardgame in the collection, try another username
-- user has a big collection, try later
-                """)
-    return liked_boardgames
+    if chunk_size is not None and chunk_size < 1:
+        raise AttributeError(f"chunk_size must be a positive integer, got {chunk_size}")
+    liked_boardgames = cache_backend.get("collection", username, [])
+    count_cache_request("collection", hit=len(liked_boardgames) > 0)
+
+    if len(liked_boardgames) > 0:
+        step = chunk_size or len(liked_boardgames)
+        for start in range(0, len(liked_boardgames), step):
+            yield liked_boardgames[start:start + step]
+        return
+
+    logger.info("updating users collections")
+    snapshot = refresh_user_collection(username)
+    included_items = [
+        i for i in snapshot.items.values() if sum([i["status"].get(f, 0) for f in filters]) > 0
+    ]
+    # if the number of liked boardgames is empty makes no sense to continue: the user doesn't have any boardgame in
+    # their collection (with the given filters), try with another username you know it has a not-empty collection
+    if len(included_items) == 0:
+        raise BggSuggestionException(f"📜⛔ No liked boardgame for user '{username}', try another username")
+    new_ids = {i["id"] for i in included_items if i["id"] not in snapshot.features}
+    logger.info(f"found {len(included_items)} liked boardgames ({len(new_ids)} new), processing...")
+
+    chunk_size = chunk_size or len(included_items)
+    for start in range(0, len(included_items), chunk_size):
+        chunk_items = included_items[start:start + chunk_size]
+        # for each boardgame in collection, get the same features we got above for the hottest (only for the
+        # boardgames not already in the snapshot, in few, chunked, requests)
+        missing_ids = list(dict.fromkeys(i["id"] for i in chunk_items if i["id"] not in snapshot.features))
+        if len(missing_ids) > 0:
+            # a failed request raises: the ids missing here are not on BGG (eg: deleted or merged boardgames), they
+            # are recorded without features, so they are not asked again until the next full refresh
+            liked_boardgames_features = get_boardgames_features(missing_ids)
+            snapshot.features.update({id_: liked_boardgames_features.get(id_, ()) for id_ in missing_ids})
+        chunk = [
+            item_to_game(
+                id_=liked_item["id"],
+                name=liked_item["name"],
+                features=snapshot.features.get(liked_item["id"], ()),
+                numplays=liked_item["numplays"]
+            ) for liked_item in chunk_items
+        ]
+        liked_boardgames.extend(chunk)
+        yield chunk
+    cache_backend.set("collection_version", username, liked_boardgames_version(liked_boardgames), ttl=COLLECTION_TTL)
+    cache_backend.set("collection", username, liked_boardgames, ttl=COLLECTION_TTL)
+    logger.info(f"feature store stats: {feature_store.stats()}")
+    logger.info(f"collection scheduler metrics: {collection_scheduler.metrics()}")
+
+
+def load_user_collection(username, filters=None):
+    return [g for chunk in iter_user_collection(username, filters=filters, chunk_size=None) for g in chunk]
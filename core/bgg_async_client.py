@@ -0,0 +1,154 @@
+import asyncio
+import logging
+import threading
+import time
+from typing import NamedTuple
+from urllib.parse import urlparse
+from core.bgg_exceptions import BggRequestException
+from core.bgg_metrics import registry as metrics_registry
+
+
+MAX_IN_FLIGHT = 4  # concurrent requests towards BGG
+RATE_LIMIT = 2.0  # requests per second, BGG answers with 429 (or 503) when it is called too often
+RATE_BURST = 4
+REQUEST_TIMEOUT = 30  # seconds
+THROTTLED_STATUSES = [429, 503]
+MAX_THROTTLED_RETRIES = 3
+
+# Enable logging
+logging.basicConfig(format='%(asctime)s - %(name)s - %(levelname)s - %(message)s', level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+class BggResponse(NamedTuple):
+    url: str
+    status: int
+    content: bytes
+
+
+# classic token bucket: 'rate' tokens per second are added to the bucket (up to 'capacity') and each request consumes
+# one of them, waiting if the bucket is empty
+class TokenBucket(object):
+    def __init__(self, rate=RATE_LIMIT, capacity=RATE_BURST):
+        if rate <= 0 or capacity < 1:
+            raise AttributeError(f"rate must be positive and capacity at least 1, got {rate} and {capacity}")
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated_at = time.monotonic()
+        self._lock = None
+
+    async def acquire(self):
+        if self._lock is None:
+            # created here in order to be bound to the running loop
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated_at) * self.rate)
+                self._updated_at = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+# asyncio client for the BGG XML API: one pooled (keep-alive) session, at most max_in_flight concurrent requests,
+# rate limited by a token bucket and with a timeout for each request. The throttled responses (429/503) are retried
+# after the 'Retry-After' seconds (or an exponential delay when missing); any other non 2xx response (or a throttled
+# one after the last retry) raises a BggRequestException
+# NB: it must always be used from the same event loop
+class AsyncBggClient(object):
+    def __init__(self, max_in_flight=MAX_IN_FLIGHT, rate=RATE_LIMIT, burst=RATE_BURST, timeout=REQUEST_TIMEOUT):
+        if max_in_flight < 1:
+            raise AttributeError(f"max_in_flight must be a positive integer, got {max_in_flight}")
+        self.max_in_flight = max_in_flight
+        self.timeout = timeout
+        self.rate_limiter = TokenBucket(rate=rate, capacity=burst)
+        self._session = None
+        self._semaphore = None
+
+    def _get_session(self):
+        # aiohttp is imported at the first request, not at startup
+        import aiohttp
+        if self._session is None or self._session.closed:
+            self._semaphore = asyncio.Semaphore(self.max_in_flight)
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.max_in_flight),
+                timeout=aiohttp.ClientTimeout(total=self.timeout)
+            )
+        return self._session
+
+    async def fetch(self, url):
+        import aiohttp
+        session = self._get_session()
+        endpoint = urlparse(url).path.rstrip("/").split("/")[-1]  # hot, thing, collection, search
+        async with self._semaphore:
+            for attempt in range(MAX_THROTTLED_RETRIES + 1):
+                await self.rate_limiter.acquire()
+                start = time.perf_counter()
+                try:
+                    async with session.get(url) as response:
+                        content = await response.read()
+                        status = response.status
+                        retry_after = response.headers.get("Retry-After")
+                except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                    metrics_registry.inc("bgg_http_requests_total", endpoint=endpoint, status="error")
+                    raise BggRequestException(f"request to {url} failed: {e!r}") from e
+                metrics_registry.inc("bgg_http_requests_total", endpoint=endpoint, status=status)
+                metrics_registry.observe("bgg_http_request_seconds", time.perf_counter() - start, endpoint=endpoint)
+                if status not in THROTTLED_STATUSES or attempt == MAX_THROTTLED_RETRIES:
+                    # an error page is never returned as if it was a (valid, empty) answer
+                    if not 200 <= status < 300:
+                        raise BggRequestException(f"request to {url} failed with status {status}")
+                    return BggResponse(url=url, status=status, content=content)
+                delay = float(retry_after) if retry_after and retry_after.isdigit() else 2 ** attempt
+                logger.warning(f"throttled by BGG ({status}), retrying in {delay}s")
+                await asyncio.sleep(delay)
+
+    async def fetch_many(self, urls):
+        return await asyncio.gather(*[self.fetch(url) for url in urls])
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+
+# synchronous facade of AsyncBggClient for the existing (threaded) callers: the async client runs on its own event
+# loop in a daemon thread, started at the first request, and all the caller threads share its connection pool
+class BggClient(object):
+    def __init__(self, **kwargs):
+        self.async_client = AsyncBggClient(**kwargs)
+        self._loop = None
+        self._thread = None
+        self._lock = threading.Lock()
+
+    @property
+    def loop(self):
+        with self._lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                self._thread = threading.Thread(target=self._loop.run_forever, name="bgg-client", daemon=True)
+                self._thread.start()
+        return self._loop
+
+    def run(self, coroutine):
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop).result()
+
+    def get(self, url):
+        return self.run(self.async_client.fetch(url))
+
+    def get_many(self, urls):
+        return self.run(self.async_client.fetch_many(urls))
+
+    def close(self):
+        with self._lock:
+            if self._loop is None:
+                return
+        self.run(self.async_client.close())
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        with self._lock:
+            self._loop.close()
+            self._loop, self._thread = None, None
@@ -0,0 +1,205 @@
+import contextlib
+import logging
+import pickle
+import threading
+import time
+import uuid
+import cachetools
+
+
+DEFAULT_MAXSIZE = 1000  # entries of each namespace of the in-process backend
+
+# Enable logging
+logging.basicConfig(format='%(asctime)s - %(name)s - %(levelname)s - %(message)s', level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+# cache of the data fetched from BGG (hotness list, collections, boardgame features), organized in namespaces, with
+# a TTL for each entry and a lock (with expiration) to let a single process (or replica) refresh an entry while the
+# others wait for it or keep reading the previous one.
+# - shared: True if the data is shared among processes (eg: the bot replicas), False if it lives in this process
+class CacheBackend(object):
+    shared = False
+
+    def get(self, namespace, key, default=None):
+        raise NotImplementedError
+
+    def set(self, namespace, key, value, ttl=None):
+        raise NotImplementedError
+
+    def delete(self, namespace, key):
+        raise NotImplementedError
+
+    def clear(self, namespace=None):
+        raise NotImplementedError
+
+    # {key: value} of the keys found
+    def get_many(self, namespace, keys):
+        found = {}
+        for key in keys:
+            value = self.get(namespace, key)
+            if value is not None:
+                found[key] = value
+        return found
+
+    def set_many(self, namespace, values, ttl=None):
+        for key, value in values.items():
+            self.set(namespace, key, value, ttl=ttl)
+
+    def contains(self, namespace, key):
+        return self.get(namespace, key) is not None
+
+    # non blocking: it yields True if the lock has been acquired (it is released at the end of the with block or,
+    # if the holder dies, after ttl seconds), False if someone else holds it
+    @contextlib.contextmanager
+    def lock(self, name, ttl=60):
+        token = self._acquire(name, ttl)
+        try:
+            yield token is not None
+        finally:
+            if token is not None:
+                self._release(name, token)
+
+    def _acquire(self, name, ttl):
+        raise NotImplementedError
+
+    def _release(self, name, token):
+        raise NotImplementedError
+
+
+# in-process backend: an LRU of (value, expires_at) for each namespace (with its own maxsize), as the original
+# module-level TTLCaches
+class InProcessCacheBackend(CacheBackend):
+    shared = False
+
+    def __init__(self, maxsizes=None, default_maxsize=DEFAULT_MAXSIZE):
+        self.maxsizes = maxsizes or {}
+        self.default_maxsize = default_maxsize
+        self._namespaces = {}
+        self._locks = {}
+        self._lock = threading.RLock()
+
+    def _namespace(self, namespace):
+        if namespace not in self._namespaces:
+            self._namespaces[namespace] = cachetools.LRUCache(
+                maxsize=self.maxsizes.get(namespace, self.default_maxsize)
+            )
+        return self._namespaces[namespace]
+
+    def get(self, namespace, key, default=None):
+        with self._lock:
+            entries = self._namespace(namespace)
+            entry = entries.get(key)
+            if entry is None:
+                return default
+            value, expires_at = entry
+            if expires_at is not None and expires_at <= time.time():
+                del entries[key]
+                return default
+            return value
+
+    def set(self, namespace, key, value, ttl=None):
+        with self._lock:
+            self._namespace(namespace)[key] = (value, time.time() + ttl if ttl is not None else None)
+
+    def delete(self, namespace, key):
+        with self._lock:
+            self._namespace(namespace).pop(key, None)
+
+    def clear(self, namespace=None):
+        with self._lock:
+            for name, entries in self._namespaces.items():
+                if namespace is None or name == namespace:
+                    entries.clear()
+            if namespace is None:
+                self._locks.clear()
+
+    def _acquire(self, name, ttl):
+        with self._lock:
+            holder = self._locks.get(name)
+            if holder is not None and holder[1] > time.time():
+                return None
+            token = uuid.uuid4().hex
+            self._locks[name] = (token, time.time() + ttl)
+            return token
+
+    def _release(self, name, token):
+        with self._lock:
+            if self._locks.get(name, (None,))[0] == token:
+                del self._locks[name]
+
+
+# backend shared by all the processes connected to the same Redis (or Redis compatible) server: client is a redis-py
+# compatible client (get, set with ex/nx/px, mget, delete, scan_iter and pipeline are used)
+# the values are pickled, the keys are '<prefix><namespace>:<key>'
+class RedisCacheBackend(CacheBackend):
+    shared = True
+
+    def __init__(self, client, prefix="bgg:"):
+        self.client = client
+        self.prefix = prefix
+
+    def _key(self, namespace, key):
+        return f"{self.prefix}{namespace}:{key}"
+
+    def get(self, namespace, key, default=None):
+        data = self.client.get(self._key(namespace, key))
+        return pickle.loads(data) if data is not None else default
+
+    def set(self, namespace, key, value, ttl=None):
+        self.client.set(
+            self._key(namespace, key), pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL),
+            ex=int(ttl) if ttl is not None else None
+        )
+
+    def delete(self, namespace, key):
+        self.client.delete(self._key(namespace, key))
+
+    def clear(self, namespace=None):
+        pattern = f"{self.prefix}{namespace}:*" if namespace is not None else f"{self.prefix}*"
+        keys = list(self.client.scan_iter(match=pattern))
+        if len(keys) > 0:
+            self.client.delete(*keys)
+
+    def get_many(self, namespace, keys):
+        keys = list(keys)
+        if len(keys) == 0:
+            return {}
+        values = self.client.mget([self._key(namespace, key) for key in keys])
+        return {key: pickle.loads(data) for key, data in zip(keys, values) if data is not None}
+
+    def set_many(self, namespace, values, ttl=None):
+        pipeline = self.client.pipeline()
+        for key, value in values.items():
+            pipeline.set(
+                self._key(namespace, key), pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL),
+                ex=int(ttl) if ttl is not None else None
+            )
+        pipeline.execute()
+
+    def _acquire(self, name, ttl):
+        token = uuid.uuid4().hex
+        if self.client.set(self._key("lock", name), token, nx=True, px=int(ttl * 1000)):
+            return token
+        return None
+
+    def _release(self, name, token):
+        # NB: not atomic, but the lock expires anyway: at worst, a lock acquired by someone else right after the
+        # expiration is released early
+        holder = self.client.get(self._key("lock", name))
+        if holder is not None and holder.decode() == token:
+            self.client.delete(self._key("lock", name))
+
+
+# url: None (or 'memory://') for the in-process backend, 'redis://...' for the shared one (redis-py required)
+def create_cache_backend(url=None, maxsizes=None):
+    if url is None or url == "" or url.startswith("memory://"):
+        return InProcessCacheBackend(maxsizes=maxsizes)
+    if url.startswith(("redis://", "rediss://", "unix://")):
+        try:
+            import redis
+        except ImportError:
+            raise AttributeError("the redis package is required for a redis:// cache backend: pip install redis")
+        logger.info(f"using the shared cache backend {url.split('@')[-1]}")
+        return RedisCacheBackend(redis.Redis.from_url(url))
+    raise AttributeError(f"unexpected cache backend url '{url}'")
@@ -0,0 +1,165 @@
+import logging
+import threading
+import time
+from typing import NamedTuple, Optional, Tuple
+import numpy as np
+from scipy import sparse
+from core import bgg_api_manager
+from core.bgg_affinity import FeatureVocabulary, AffinityAccumulator, encode_features, AFFINITY_MODES, \
+    RANKED_COLUMNS
+from core.bgg_exceptions import BggSuggestionException
+from core.bgg_records import Game, intern_features
+
+
+CATALOG_RANKED_LIMIT = 50  # as many suggestions as the hotness list could give
+
+# Enable logging
+logging.basicConfig(format='%(asctime)s - %(name)s - %(levelname)s - %(message)s', level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+# inverted index of the whole local catalog (all the boardgames in the feature store), the HotnessSnapshot
+# counterpart for tens of thousands of candidates:
+# - version: fingerprint of the feature store the index was built from
+# - boardgames / ids: the catalog boardgames (Game records) and their ids
+# - vocabulary: the (frozen) interned values of the catalog features
+# - matrix: CSR (n_games x len(vocabulary)) feature counts of each boardgame
+# - postings: the same matrix as CSC: column j is the posting list (boardgames and counts) of the feature value j
+# - n_features: number of features of each boardgame (the affinity denominator)
+# - rankable: False for the boardgames without thumbnail or description (never returned as suggestions)
+# NB: it is never modified after the creation, so it can be shared among threads and swapped atomically
+class CatalogIndex(NamedTuple):
+    version: str
+    boardgames: Tuple[Game, ...]
+    ids: np.ndarray
+    vocabulary: FeatureVocabulary
+    matrix: sparse.csr_matrix
+    postings: sparse.csc_matrix
+    n_features: np.ndarray
+    rankable: np.ndarray
+    created_at: float
+
+
+# records: iterable of (id, feature store record), eg: FeatureStore.iter_records()
+def build_catalog_index(records, version=""):
+    boardgames = tuple(
+        Game(
+            id=str(id_),
+            name=record.get("name"),
+            features=intern_features(record["features"]),
+            description=record.get("description"),
+            thumbnail=record.get("thumbnail")
+        ) for id_, record in records
+    )
+    vocabulary = FeatureVocabulary()
+    matrix = encode_features([b.features for b in boardgames], vocabulary)
+    postings = matrix.tocsc()
+    n_features = np.asarray(matrix.sum(axis=1), dtype=float).ravel()
+    rankable = np.array([b.thumbnail is not None and b.description is not None for b in boardgames], dtype=bool)
+    for array in [matrix.data, postings.data, n_features, rankable]:
+        array.setflags(write=False)
+    return CatalogIndex(
+        version=version,
+        boardgames=boardgames,
+        ids=np.array([b.id for b in boardgames], dtype=str),
+        vocabulary=vocabulary.freeze(),
+        matrix=matrix,
+        postings=postings,
+        n_features=n_features,
+        rankable=rankable,
+        created_at=time.time()
+    )
+
+
+# same ranked_df of rank_vectorized (same columns, same affinity), but with the catalog boardgames as candidates:
+# the postings of the liked features are walked and only the candidates sharing at least one feature are scored
+# only the first 'limit' candidates are returned
+def rank_catalog(catalog_index, liked_boardgames, mode='sum_weighted', limit=CATALOG_RANKED_LIMIT):
+    import pandas as pd
+    if mode not in AFFINITY_MODES:
+        raise AttributeError(f"mode '{mode}' not in allowed ones: {AFFINITY_MODES}")
+    accumulator = AffinityAccumulator(
+        catalog_index.matrix, catalog_index.n_features, catalog_index.vocabulary, mode=mode,
+        postings=catalog_index.postings
+    ).add(liked_boardgames)
+
+    candidates = accumulator.candidates()
+    candidates = candidates[catalog_index.rankable[candidates]]
+    # by total_affinity (descending) and then by id, as rank_vectorized
+    order = np.lexsort((catalog_index.ids[candidates], -accumulator.total[candidates]))
+    # the boardgames the user already likes are excluded
+    liked_names = {g.name for g in liked_boardgames}
+    liked_ids = {g.id for g in liked_boardgames}
+    rows = []
+    for row in candidates[order]:
+        boardgame = catalog_index.boardgames[row]
+        if boardgame.name not in liked_names and boardgame.id not in liked_ids:
+            rows.append(row)
+            if len(rows) == limit:
+                break
+    if len(rows) == 0:
+        return pd.DataFrame(columns=RANKED_COLUMNS)
+
+    boardgames = [catalog_index.boardgames[row] for row in rows]
+    return pd.DataFrame({
+        "id_hot": [b.id for b in boardgames],
+        "name_hot": [b.name for b in boardgames],
+        "thumbnail": [b.thumbnail for b in boardgames],
+        "description": [b.description for b in boardgames],
+        "total_affinity": accumulator.total[rows],
+        "because_you_also_like": accumulator.reasons(rows, [b.features for b in boardgames])
+    })
+
+
+# it holds the current CatalogIndex, built from the feature store (bgg_api_manager.feature_store by default): refresh()
+# rebuilds it only if the store changed and swaps it in with a single assignment, as HotnessManager does
+class CatalogManager(object):
+    def __init__(self, store=None):
+        self.store = store
+        self._index: Optional[CatalogIndex] = None
+        self._refresh_lock = threading.Lock()
+
+    @property
+    def index(self):
+        return self._index
+
+    def refresh(self):
+        with self._refresh_lock:
+            store = self.store if self.store is not None else bgg_api_manager.feature_store
+            version = store.fingerprint()
+            current = self._index
+            if current is not None and current.version == version:
+                return current
+            start = time.perf_counter()
+            self._index = build_catalog_index(store.iter_records(), version=version)
+            logger.info(f"catalog index of {len(self._index.boardgames)} boardgames and "
+                        f"{self._index.postings.nnz} postings built in {time.perf_counter() - start:.1f}s")
+            return self._index
+
+    # it starts the build in a daemon thread, unless a build is already running (get() waits for it)
+    def warm_up(self):
+        if self._refresh_lock.locked():
+            return False
+        threading.Thread(target=self.refresh, name="catalog-refresh", daemon=True).start()
+        return True
+
+    # only if the index is in use (the scheduled refresh doesn't build an index nobody asked for)
+    def refresh_if_loaded(self):
+        if self._index is not None:
+            return self.refresh()
+
+    def get(self):
+        index = self._index
+        if index is None:
+            # a warm up may be running: wait for it instead of building the index twice
+            with self._refresh_lock:
+                index = self._index
+            index = index if index is not None else self.refresh()
+        if len(index.boardgames) == 0:
+            logger.error("CATALOG IS EMPTY")
+            raise BggSuggestionException("😞💔 The boardgames catalog is empty. "
+                                         "Try again later or contact the administrator")
+        return index
+
+
+catalog_manager = CatalogManager()
@@ -0,0 +1,175 @@
+# Bulk ingestion of the /thing data of a range of BGG ids into the feature store (the catalog the bot suggests from
+# with BggSuggestions(source='catalog'), and a warm cache for the collections):
+# - the ids are streamed in /thing requests of THING_CHUNK_SIZE ids, 'window' requests at a time, through the rate
+#   limited bgg_client: only one window of responses is in memory
+# - each window is parsed (iterparse) and written to the store, then the checkpoint of the job (the next id to
+#   request) is saved in the same SQLite file: a crashed or interrupted job resumes from its last window
+# - the throughput (games per second) is logged every PROGRESS_INTERVAL seconds
+#
+# usage (from the repository root):
+#   python -m core.bgg_catalog_ingestion --from-id 1 --to-id 400000 [--store resources/feature_store.sqlite]
+#       [--rate 2] [--window 4] [--job name] [--restart]
+# against the local stand-in server: BGG_API_URL=http://127.0.0.1:8765/xmlapi2 python -m core.bgg_catalog_ingestion ...
+import argparse
+import logging
+import sqlite3
+import time
+from core.bgg_api_manager import bgg_client, BOARDGAME_INFO_URL, THING_CHUNK_SIZE, STORED_INFO
+from core.bgg_async_client import TokenBucket, RATE_LIMIT, RATE_BURST
+from core.bgg_exceptions import BggRequestException, BggApiErrorException
+from core.bgg_feature_store import FeatureStore, FEATURE_STORE_PATH, INGESTION_CHECKPOINTS_TABLE
+from core.bgg_xml_parser import iter_thing_items
+
+
+INGESTION_WINDOW = 4  # /thing requests in flight together (the client bounds them to its max_in_flight anyway)
+INGESTION_MAX_RETRIES = 5  # for each window, before giving up (the job can be resumed later)
+INGESTION_RETRY_DELAY = 30  # seconds, doubled at each retry
+PROGRESS_INTERVAL = 10  # seconds
+# the id ranges include RPG items, videogames and accessories too: only these types are requested (and kept)
+CATALOG_ITEM_TYPES = ["boardgame", "boardgameexpansion"]
+
+# Enable logging
+logging.basicConfig(format='%(asctime)s - %(name)s - %(levelname)s - %(message)s', level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+# progress of each ingestion job, in the same SQLite file of the store it fills
+class IngestionCheckpoints(object):
+    def __init__(self, path=FEATURE_STORE_PATH):
+        self.path = path
+        self._connection = sqlite3.connect(path)
+        self._connection.execute(
+            f"CREATE TABLE IF NOT EXISTS {INGESTION_CHECKPOINTS_TABLE} ("
+            "job TEXT PRIMARY KEY, "
+            "next_id INTEGER NOT NULL, "
+            "ingested INTEGER NOT NULL, "
+            "updated_at REAL NOT NULL)"
+        )
+        self._connection.commit()
+
+    # it returns (next_id, ingested) of the job, None if the job never started
+    def load(self, job):
+        return self._connection.execute(
+            f"SELECT next_id, ingested FROM {INGESTION_CHECKPOINTS_TABLE} WHERE job = ?", (job,)
+        ).fetchone()
+
+    def save(self, job, next_id, ingested):
+        self._connection.execute(
+            f"INSERT OR REPLACE INTO {INGESTION_CHECKPOINTS_TABLE} (job, next_id, ingested, updated_at) "
+            "VALUES (?, ?, ?, ?)",
+            (job, next_id, ingested, time.time())
+        )
+        self._connection.commit()
+
+    def delete(self, job):
+        self._connection.execute(f"DELETE FROM {INGESTION_CHECKPOINTS_TABLE} WHERE job = ?", (job,))
+        self._connection.commit()
+
+    def close(self):
+        self._connection.close()
+
+
+# it fetches the /thing data of a window of chunks of ids (a failed request raises BggRequestException)
+def _fetch_window(client, chunks):
+    responses = client.get_many([
+        BOARDGAME_INFO_URL.format(id=",".join(str(id_) for id_ in chunk)) + f"&type={','.join(CATALOG_ITEM_TYPES)}"
+        for chunk in chunks
+    ])
+    records = {}
+    for response in responses:
+        for id_, record in iter_thing_items(response.content, STORED_INFO, types=CATALOG_ITEM_TYPES):
+            records[id_] = {k: record[k] for k in ["features"] + STORED_INFO}
+    return records
+
+
+# it ingests the ids in [from_id, to_id] (resuming the job from its checkpoint, if any) and it returns the stats of
+# this run: {"requested_ids", "ingested", "elapsed", "games_per_second", "next_id"}
+def ingest(from_id, to_id, store, checkpoints, job=None, window=INGESTION_WINDOW, chunk_size=THING_CHUNK_SIZE,
+           client=bgg_client, ttl=None, retry_delay=INGESTION_RETRY_DELAY):
+    if from_id > to_id or window < 1 or chunk_size < 1:
+        raise AttributeError(f"invalid ingestion of [{from_id}, {to_id}] with window {window} and chunk {chunk_size}")
+    job = job or f"{from_id}-{to_id}"
+    checkpoint = checkpoints.load(job)
+    next_id, ingested_before = checkpoint if checkpoint is not None else (from_id, 0)
+    if checkpoint is not None:
+        logger.info(f"resuming job '{job}' from id {next_id} ({ingested_before} games already ingested)")
+
+    start = last_progress = time.monotonic()
+    requested_ids, ingested = 0, 0
+    while next_id <= to_id:
+        window_end = min(next_id + window * chunk_size, to_id + 1)
+        ids = list(range(next_id, window_end))
+        chunks = [ids[i:i + chunk_size] for i in range(0, len(ids), chunk_size)]
+        for attempt in range(INGESTION_MAX_RETRIES + 1):
+            try:
+                records = _fetch_window(client, chunks)
+                break
+            except (BggRequestException, BggApiErrorException) as e:
+                if attempt == INGESTION_MAX_RETRIES:
+                    logger.error(f"job '{job}' stopped at id {next_id}, run it again to resume")
+                    raise
+                delay = retry_delay * 2 ** attempt
+                logger.warning(f"window from id {next_id} failed ({e!r}), retrying in {delay}s")
+                time.sleep(delay)
+        if len(records) > 0:
+            store.put_many(records, ttl=ttl)
+        # at least once: the window is written before the checkpoint moves past it
+        next_id = window_end
+        requested_ids += len(ids)
+        ingested += len(records)
+        checkpoints.save(job, next_id, ingested_before + ingested)
+
+        now = time.monotonic()
+        if now - last_progress >= PROGRESS_INTERVAL:
+            last_progress = now
+            games_per_second = ingested / (now - start)
+            eta = (to_id + 1 - next_id) / (requested_ids / (now - start))
+            logger.info(f"job '{job}': id {next_id - 1}/{to_id}, {ingested_before + ingested} games, "
+                        f"{games_per_second:.1f} games/s, ETA {eta / 60:.0f} min")
+
+    elapsed = time.monotonic() - start
+    stats = {
+        "requested_ids": requested_ids,
+        "ingested": ingested,
+        "elapsed": elapsed,
+        "games_per_second": ingested / elapsed if elapsed > 0 else 0,
+        "next_id": next_id
+    }
+    logger.info(f"job '{job}' done: {stats}")
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ingest the /thing data of a range of BGG ids into the feature store")
+    parser.add_argument("--from-id", type=int, required=True)
+    parser.add_argument("--to-id", type=int, required=True)
+    parser.add_argument("--store", default=FEATURE_STORE_PATH)
+    parser.add_argument("--rate", type=float, default=RATE_LIMIT, help="requests per second")
+    parser.add_argument("--window", type=int, default=INGESTION_WINDOW, help="concurrent /thing requests")
+    parser.add_argument("--ttl-days", type=float, default=None, help="store entries lifetime (default: store TTL)")
+    parser.add_argument("--job", help="checkpoint name (default: <from-id>-<to-id>)")
+    parser.add_argument("--restart", action="store_true", help="ignore the checkpoint of the job")
+    args = parser.parse_args()
+
+    bgg_client.async_client.rate_limiter = TokenBucket(rate=args.rate, capacity=max(RATE_BURST, int(args.rate)))
+    # the whole catalog is kept: no LRU eviction
+    store = FeatureStore(path=args.store, max_entries=None)
+    checkpoints = IngestionCheckpoints(args.store)
+    job = args.job or f"{args.from_id}-{args.to_id}"
+    if args.restart:
+        checkpoints.delete(job)
+    try:
+        ingest(
+            args.from_id, args.to_id, store, checkpoints, job=job, window=args.window,
+            ttl=args.ttl_days * 60*60*24 if args.ttl_days is not None else None
+        )
+    except KeyboardInterrupt:
+        logger.info(f"job '{job}' interrupted, run it again to resume")
+    finally:
+        checkpoints.close()
+        store.close()
+        bgg_client.close()
+
+
+if __name__ == '__main__':
+    main()
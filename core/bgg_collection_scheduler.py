@@ -0,0 +1,122 @@
+import asyncio
+import collections
+import logging
+import random
+import time
+from urllib.parse import quote
+import cachetools
+import numpy as np
+from core.bgg_exceptions import BggCollectionQueuedException, BggRequestException
+from core.bgg_metrics import registry as metrics_registry
+
+
+COLLECTION_MAX_ATTEMPTS = 8
+COLLECTION_BASE_DELAY = 2  # seconds, doubled at each attempt
+COLLECTION_MAX_DELAY = 60  # seconds
+COLLECTION_RESULT_TTL = 60  # seconds a completed fetch is reused by the following requests for the same username
+QUEUED_STATUS = 202  # BGG: "your request for this collection has been accepted and will be processed"
+READY_STATUS = 200
+MODIFIED_SINCE_PARAM = "&modifiedsince={modifiedsince}"  # only the items modified since then (YY-MM-DD HH:MM:SS)
+
+# Enable logging
+logging.basicConfig(format='%(asctime)s - %(name)s - %(levelname)s - %(message)s', level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+# it fetches the users' collections on the event loop of a BggClient:
+# - the 202 (queued) responses are retried with exponential backoff and jitter, without blocking any thread
+# - concurrent requests for the same username (and modifiedsince) are coalesced into a single in-flight fetch (and a
+#   completed fetch is reused for COLLECTION_RESULT_TTL seconds)
+# - submit() returns a concurrent.futures.Future, so the callers can be notified when the collection is ready
+# - metrics() exposes the queue wait times (from the first request to the collection being ready)
+class CollectionFetchScheduler(object):
+    def __init__(self, client, url_template, max_attempts=COLLECTION_MAX_ATTEMPTS, base_delay=COLLECTION_BASE_DELAY,
+                 max_delay=COLLECTION_MAX_DELAY, result_ttl=COLLECTION_RESULT_TTL):
+        if max_attempts < 1:
+            raise AttributeError(f"max_attempts must be a positive integer, got {max_attempts}")
+        self.client = client
+        self.url_template = url_template
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        # both only accessed from the client event loop
+        self._in_flight = {}
+        self._completed = cachetools.TTLCache(ttl=result_ttl, maxsize=100)
+        # metrics
+        self.completed = 0
+        self.coalesced = 0
+        self.retries = 0
+        self.failed = 0
+        self.wait_times = collections.deque(maxlen=1000)
+
+    @staticmethod
+    def _key(username, modifiedsince):
+        # BGG usernames are case insensitive
+        return username.strip().lower(), modifiedsince
+
+    def _backoff_delay(self, attempt):
+        # "equal jitter": half of the exponential delay plus a random share of the other half
+        delay = min(self.max_delay, self.base_delay * 2 ** attempt)
+        return delay / 2 + random.uniform(0, delay / 2)
+
+    async def fetch(self, username, modifiedsince=None):
+        key = self._key(username, modifiedsince)
+        if key in self._completed:
+            self.coalesced += 1
+            return self._completed[key]
+        if key in self._in_flight:
+            self.coalesced += 1
+        else:
+            self._in_flight[key] = asyncio.ensure_future(self._fetch_with_backoff(key, username, modifiedsince))
+        # shield: a cancelled caller must not cancel the fetch shared with the other callers
+        return await asyncio.shield(self._in_flight[key])
+
+    async def _fetch_with_backoff(self, key, username, modifiedsince):
+        started_at = time.monotonic()
+        url = self.url_template.format(username=username)
+        if modifiedsince is not None:
+            url += MODIFIED_SINCE_PARAM.format(modifiedsince=quote(modifiedsince))
+        try:
+            for attempt in range(self.max_attempts):
+                # the error responses raise a BggRequestException (never cached in _completed)
+                response = await self.client.async_client.fetch(url)
+                if response.status not in [QUEUED_STATUS, READY_STATUS]:
+                    raise BggRequestException(f"collection of '{username}' failed with status {response.status}")
+                if response.status == READY_STATUS:
+                    wait_time = time.monotonic() - started_at
+                    self.completed += 1
+                    self.wait_times.append(wait_time)
+                    metrics_registry.observe("bgg_collection_queue_seconds", wait_time)
+                    logger.info(f"collection of '{username}' ready after {wait_time:.1f}s and {attempt + 1} attempts")
+                    self._completed[key] = response
+                    return response
+                if attempt < self.max_attempts - 1:
+                    self.retries += 1
+                    metrics_registry.inc("bgg_collection_queued_retries_total")
+                    await asyncio.sleep(self._backoff_delay(attempt))
+            self.failed += 1
+            metrics_registry.inc("bgg_collection_queued_failures_total")
+            raise BggCollectionQueuedException(
+                f"collection of '{username}' still queued after {self.max_attempts} attempts"
+            )
+        finally:
+            del self._in_flight[key]
+
+    def submit(self, username, modifiedsince=None):
+        return asyncio.run_coroutine_threadsafe(self.fetch(username, modifiedsince), self.client.loop)
+
+    def fetch_sync(self, username, modifiedsince=None, timeout=None):
+        return self.submit(username, modifiedsince).result(timeout=timeout)
+
+    def metrics(self):
+        wait_times = np.array(self.wait_times) if len(self.wait_times) > 0 else np.zeros(1)
+        return {
+            "in_flight": len(self._in_flight),
+            "completed": self.completed,
+            "coalesced": self.coalesced,
+            "retries": self.retries,
+            "failed": self.failed,
+            "wait_time_p50": float(np.percentile(wait_times, 50)),
+            "wait_time_p95": float(np.percentile(wait_times, 95)),
+            "wait_time_max": float(wait_times.max())
+        }
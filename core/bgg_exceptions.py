@@ -1,2 +1,22 @@
 class BggSuggestionException(BaseException):
     pass
+
+
+class BggRequestException(Exception):
+    pass
+
+
+class BggCollectionQueuedException(BggRequestException):
+    pass
+
+
+class BggApiErrorException(BggRequestException):
+    pass
+
+
+class BggBusyException(BggSuggestionException):
+    pass
+
+
+class BggDuplicateRequestException(BggSuggestionException):
+    pass
@@ -0,0 +1,171 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+
+# anchored to the repository root, not to the working directory
+RESOURCES_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "resources")
+FEATURE_STORE_PATH = os.environ.get("BGG_FEATURE_STORE_PATH", os.path.join(RESOURCES_DIR, "feature_store.sqlite"))
+FEATURE_STORE_TTL = 60*60*24*30  # 30 days: categories, mechanics and families almost never change
+# NB: no LRU eviction at all on a store holding an ingested catalog (see core/bgg_catalog_ingestion.py)
+FEATURE_STORE_MAX_ENTRIES = int(os.environ.get("BGG_FEATURE_STORE_MAX_ENTRIES", "50000"))
+# written by the catalog ingestion in the same SQLite file: its presence marks a store holding an ingested catalog
+INGESTION_CHECKPOINTS_TABLE = "ingestion_checkpoints"
+SQLITE_MAX_VARIABLES = 500  # keep "IN (?, ?...)" queries below the SQLite limit on the number of variables
+
+# Enable logging
+logging.basicConfig(format='%(asctime)s - %(name)s - %(levelname)s - %(message)s', level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+# persistent (SQLite) store of the /thing data of each boardgame, keyed by the boardgame id.
+# Each entry has its own expiration time (ttl) and, when the store grows over max_entries, the least recently used
+# entries are evicted. Hits and misses are counted in order to monitor the store effectiveness.
+# The connection is opened lazily, at the first access, and it is shared among threads through a lock
+class FeatureStore(object):
+    def __init__(self, path=FEATURE_STORE_PATH, ttl=FEATURE_STORE_TTL, max_entries=FEATURE_STORE_MAX_ENTRIES):
+        if max_entries is not None and max_entries < 1:
+            raise AttributeError(f"max_entries must be a positive integer or None, got {max_entries}")
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._connection = None
+        self._lock = threading.RLock()
+
+    def _connect(self):
+        if self._connection is None:
+            if os.path.dirname(self.path):
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            self._connection = sqlite3.connect(self.path, check_same_thread=False)
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS boardgame_features ("
+                "id TEXT PRIMARY KEY, "
+                "data TEXT NOT NULL, "
+                "expires_at REAL NOT NULL, "
+                "accessed_at REAL NOT NULL)"
+            )
+            self._connection.execute(
+                "CREATE INDEX IF NOT EXISTS boardgame_features_accessed_at ON boardgame_features (accessed_at)"
+            )
+            self._connection.commit()
+            if self.max_entries is not None and self.holds_catalog():
+                # the LRU eviction would drop most of the catalog at the first write
+                logger.info(f"the feature store {self.path} holds an ingested catalog: LRU eviction disabled")
+                self.max_entries = None
+        return self._connection
+
+    def holds_catalog(self):
+        with self._lock:
+            return self._connect().execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (INGESTION_CHECKPOINTS_TABLE,)
+            ).fetchone() is not None
+
+    def get_many(self, ids):
+        ids = [str(id_) for id_ in ids]
+        now = time.time()
+        found, expired = {}, []
+        with self._lock:
+            connection = self._connect()
+            for start in range(0, len(ids), SQLITE_MAX_VARIABLES):
+                chunk = ids[start:start + SQLITE_MAX_VARIABLES]
+                rows = connection.execute(
+                    f"SELECT id, data, expires_at FROM boardgame_features "
+                    f"WHERE id IN ({','.join('?' * len(chunk))})",
+                    chunk
+                ).fetchall()
+                for id_, data, expires_at in rows:
+                    if expires_at > now:
+                        found[id_] = json.loads(data)
+                    else:
+                        expired.append(id_)
+            # refresh the access time of the hits (LRU) and drop the expired entries
+            connection.executemany(
+                "UPDATE boardgame_features SET accessed_at = ? WHERE id = ?", [(now, id_) for id_ in found]
+            )
+            connection.executemany("DELETE FROM boardgame_features WHERE id = ?", [(id_,) for id_ in expired])
+            connection.commit()
+            self.hits += len(found)
+            self.misses += len(set(ids)) - len(found)
+        return found
+
+    def get(self, id_, default=None):
+        return self.get_many([id_]).get(str(id_), default)
+
+    def put_many(self, records, ttl=None):
+        ttl = self.ttl if ttl is None else ttl
+        now = time.time()
+        with self._lock:
+            connection = self._connect()
+            connection.executemany(
+                "INSERT OR REPLACE INTO boardgame_features (id, data, expires_at, accessed_at) VALUES (?, ?, ?, ?)",
+                [(str(id_), json.dumps(record), now + ttl, now) for id_, record in records.items()]
+            )
+            connection.commit()
+            self._evict()
+
+    def put(self, id_, record, ttl=None):
+        self.put_many({id_: record}, ttl=ttl)
+
+    def _evict(self):
+        # first remove the expired entries, then, if still needed, the least recently used ones
+        connection = self._connect()
+        connection.execute("DELETE FROM boardgame_features WHERE expires_at <= ?", (time.time(),))
+        if self.max_entries is not None:
+            exceeding = len(self) - self.max_entries
+            if exceeding > 0:
+                logger.info(f"evicting {exceeding} boardgames from the feature store")
+                connection.execute(
+                    "DELETE FROM boardgame_features WHERE id IN "
+                    "(SELECT id FROM boardgame_features ORDER BY accessed_at ASC LIMIT ?)",
+                    (exceeding,)
+                )
+        connection.commit()
+
+    # it iterates over all the (not expired) entries, in batches, without counting them as hits nor refreshing their
+    # access time: it is a scan of the store (eg: to index the whole catalog), not a lookup
+    def iter_records(self, batch_size=1000):
+        last_id = ""
+        while True:
+            with self._lock:
+                rows = self._connect().execute(
+                    "SELECT id, data FROM boardgame_features WHERE id > ? AND expires_at > ? ORDER BY id LIMIT ?",
+                    (last_id, time.time(), batch_size)
+                ).fetchall()
+            for id_, data in rows:
+                yield id_, json.loads(data)
+            if len(rows) < batch_size:
+                return
+            last_id = rows[-1][0]
+
+    # it changes whenever an entry is added, replaced or removed: the data derived from the whole store (eg: the
+    # catalog index) is rebuilt only if it changed
+    def fingerprint(self):
+        with self._lock:
+            count, last_expires_at = self._connect().execute(
+                "SELECT COUNT(*), MAX(expires_at) FROM boardgame_features"
+            ).fetchone()
+        return f"{count}-{last_expires_at or 0:.6f}"
+
+    def stats(self):
+        requests = self.hits + self.misses
+        return {
+            "entries": len(self),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / requests if requests > 0 else 0
+        }
+
+    def close(self):
+        with self._lock:
+            if self._connection is not None:
+                self._connection.close()
+                self._connection = None
+
+    def __len__(self):
+        with self._lock:
+            return self._connect().execute("SELECT COUNT(*) FROM boardgame_features").fetchone()[0]
@@ -0,0 +1,258 @@
+import hashlib
+import json
+import logging
+import os
+import pickle
+import threading
+import time
+from typing import NamedTuple, Optional, Tuple
+import numpy as np
+from scipy import sparse
+from core.bgg_affinity import FeatureVocabulary, encode_features
+from core.bgg_api_manager import load_hot_boardgames, hot_boardgames_fetched_at, HOTNESS_TTL
+from core.bgg_exceptions import BggSuggestionException
+from core.bgg_feature_store import RESOURCES_DIR
+from core.bgg_metrics import registry as metrics_registry
+from core.bgg_records import Game
+
+
+# the refresh runs in background every HOTNESS_REFRESH_INTERVAL minutes (well within the hotness cache TTL, so it is
+# the refresh, never a request, that pays the reload): a snapshot older than HOTNESS_MAX_AGE is stale, it is still
+# served but a background refresh is triggered by the requests reading it
+HOTNESS_REFRESH_INTERVAL = 10  # minutes
+HOTNESS_MAX_AGE = HOTNESS_TTL + HOTNESS_REFRESH_INTERVAL * 60  # seconds
+HOTNESS_REFRESH_RETRIES = 3
+HOTNESS_RETRY_DELAY = 10  # seconds, doubled at each retry
+# a new hotness list is swapped in only if valid: at least HOTNESS_MIN_BOARDGAMES boardgames, no duplicates and at
+# least HOTNESS_MIN_RANKABLE_RATIO of them with features, thumbnail and description
+HOTNESS_MIN_BOARDGAMES = 10
+HOTNESS_MIN_RANKABLE_RATIO = 0.5
+# the last good hotness list is persisted here, in order to serve it right after a restart (empty to disable)
+HOTNESS_SNAPSHOT_PATH = os.environ.get(
+    "BGG_HOTNESS_SNAPSHOT_PATH", os.path.join(RESOURCES_DIR, "hotness_snapshot.pickle")
+)
+
+
+# Enable logging
+logging.basicConfig(format='%(asctime)s - %(name)s - %(levelname)s - %(message)s', level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+# everything the affinity calculation needs from the hotness list, computed once per hotness list:
+# - version: digest of the hotness list content, it changes only when the hotness list changes
+# - boardgames: the hot boardgames (Game records)
+# - vocabulary: the (frozen) interned values of the hot boardgames features
+# - matrix: CSR matrix (n_hot x len(vocabulary)) with the feature counts of each hot boardgame
+# - n_features: number of features of each hot boardgame (the affinity denominator)
+# - rankable: False for the hot boardgames without thumbnail or description (never returned as suggestions)
+# NB: it is never modified after the creation, so it can be shared among threads and swapped atomically
+class HotnessSnapshot(NamedTuple):
+    version: str
+    boardgames: Tuple[Game, ...]
+    vocabulary: FeatureVocabulary
+    matrix: sparse.csr_matrix
+    n_features: np.ndarray
+    rankable: np.ndarray
+    created_at: float
+
+
+def hotness_version(hot_boardgames):
+    content = [(b.id, b.name, [f.value for f in b.features]) for b in hot_boardgames]
+    return hashlib.sha1(json.dumps(content).encode()).hexdigest()
+
+
+def build_hotness_snapshot(hot_boardgames, version=None):
+    vocabulary = FeatureVocabulary()
+    matrix = encode_features([b.features for b in hot_boardgames], vocabulary)
+    matrix.data.setflags(write=False)
+    n_features = np.asarray(matrix.sum(axis=1), dtype=float).ravel()
+    n_features.setflags(write=False)
+    rankable = np.array(
+        [b.thumbnail is not None and b.description is not None for b in hot_boardgames], dtype=bool
+    )
+    rankable.setflags(write=False)
+    return HotnessSnapshot(
+        version=version or hotness_version(hot_boardgames),
+        boardgames=tuple(hot_boardgames),
+        vocabulary=vocabulary.freeze(),
+        matrix=matrix,
+        n_features=n_features,
+        rankable=rankable,
+        created_at=time.time()
+    )
+
+
+# it returns the reason why the hotness list can't replace the current one, None if it is valid
+def validate_hot_boardgames(hot_boardgames, min_boardgames=HOTNESS_MIN_BOARDGAMES):
+    if len(hot_boardgames) < min_boardgames:
+        return f"{len(hot_boardgames)} boardgames, at least {min_boardgames} expected"
+    if len({b.id for b in hot_boardgames}) < len(hot_boardgames):
+        return "duplicated boardgames"
+    rankable = [b for b in hot_boardgames if len(b.features) > 0 and b.thumbnail is not None and b.description]
+    if len(rankable) < len(hot_boardgames) * HOTNESS_MIN_RANKABLE_RATIO:
+        return f"only {len(rankable)} boardgames with features, thumbnail and description"
+    return None
+
+
+# it holds the current HotnessSnapshot with stale-while-revalidate semantics:
+# - get() always returns the last good snapshot immediately, even if stale: in that case it starts a background
+#   refresh (only the very first get(), without any snapshot yet, waits for the load)
+# - refresh() (called by the scheduler every HOTNESS_REFRESH_INTERVAL minutes) reloads the hotness list, retrying
+#   on failures, validates it and, only if it changed, rebuilds the snapshot and swaps it in with a single assignment
+# - status() exposes the snapshot age and the refresh failures
+# - warm_up() (at startup) loads the hotness list persisted in path (if any) and refreshes it in background
+class HotnessManager(object):
+    def __init__(self, loader=load_hot_boardgames, max_age=HOTNESS_MAX_AGE, retries=HOTNESS_REFRESH_RETRIES,
+                 retry_delay=HOTNESS_RETRY_DELAY, min_boardgames=HOTNESS_MIN_BOARDGAMES, path=None,
+                 loader_fetched_at=None):
+        self.loader = loader
+        # it returns when the list returned by the loader was fetched (None: now, eg: a loader without cache)
+        self.loader_fetched_at = loader_fetched_at
+        self.path = path
+        self.max_age = max_age
+        self.retries = retries
+        self.retry_delay = retry_delay
+        self.min_boardgames = min_boardgames
+        self._snapshot: Optional[HotnessSnapshot] = None
+        self._refresh_lock = threading.Lock()
+        # status
+        # when the current (valid) hotness list was fetched from BGG: the loader may return a cached list
+        self.fetched_at = None
+        self.consecutive_failures = 0
+        self.failures = 0
+        self.last_error = None
+
+        metrics_registry.gauge("bgg_hotness_snapshot_age_seconds", lambda: self.status()["age"])
+        metrics_registry.gauge("bgg_hotness_refresh_consecutive_failures", lambda: self.consecutive_failures)
+
+    @property
+    def snapshot(self):
+        return self._snapshot
+
+    def is_stale(self):
+        return self.fetched_at is None or time.time() - self.fetched_at > self.max_age
+
+    def _load(self):
+        try:
+            hot_boardgames = self.loader()
+        except (Exception, BggSuggestionException) as e:
+            return None, f"load failed: {e!r}"
+        error = validate_hot_boardgames(hot_boardgames, self.min_boardgames)
+        return (hot_boardgames, None) if error is None else (None, error)
+
+    def _failed(self, error):
+        self.consecutive_failures += 1
+        self.failures += 1
+        self.last_error = error
+        metrics_registry.inc("bgg_hotness_refresh_failures_total")
+
+    # retries: None for the manager's default
+    def refresh(self, retries=None):
+        retries = self.retries if retries is None else retries
+        with self._refresh_lock:
+            for attempt in range(retries + 1):
+                hot_boardgames, error = self._load()
+                if error is None:
+                    break
+                self._failed(error)
+                # never replace a good hotness list with an empty (or broken) one
+                logger.warning(f"invalid hotness list ({error}), keeping the current snapshot")
+                if attempt < retries:
+                    time.sleep(self.retry_delay * 2 ** attempt)
+            else:
+                return self._snapshot
+
+            fetched_at = self.loader_fetched_at() if self.loader_fetched_at is not None else None
+            self.fetched_at = fetched_at or time.time()
+            self.consecutive_failures = 0
+            self._persist(hot_boardgames)
+            return self._swap(hot_boardgames)
+
+    def _swap(self, hot_boardgames):
+        current = self._snapshot
+        version = hotness_version(hot_boardgames)
+        if current is not None and current.version == version:
+            return current
+        logger.info(f"building hotness snapshot {version[:8]}")
+        self._snapshot = build_hotness_snapshot(hot_boardgames, version=version)
+        return self._snapshot
+
+    def _persist(self, hot_boardgames):
+        if not self.path:
+            return
+        try:
+            # written aside and then renamed: a crash never leaves a truncated file
+            with open(f"{self.path}.tmp", "wb") as f:
+                pickle.dump((self.fetched_at, list(hot_boardgames)), f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(f"{self.path}.tmp", self.path)
+        except OSError as e:
+            logger.warning(f"unable to persist the hotness list in {self.path}: {e!r}")
+
+    # it loads the persisted hotness list (if any and valid) and it returns the snapshot. Its age is the one of the
+    # persisted list: if stale, the next get() triggers a background refresh
+    def load_persisted(self):
+        if not self.path or not os.path.exists(self.path):
+            return None
+        try:
+            with open(self.path, "rb") as f:
+                fetched_at, hot_boardgames = pickle.load(f)
+        except (OSError, pickle.UnpicklingError, EOFError, ValueError, TypeError, AttributeError) as e:
+            logger.warning(f"unable to load the hotness list persisted in {self.path}: {e!r}")
+            return None
+        error = validate_hot_boardgames(hot_boardgames, self.min_boardgames)
+        if error is not None:
+            logger.warning(f"invalid persisted hotness list ({error}), ignored")
+            return None
+        with self._refresh_lock:
+            if self._snapshot is None:
+                self.fetched_at = fetched_at
+                self._swap(hot_boardgames)
+            return self._snapshot
+
+    # non blocking (but for the load of the persisted list, a few milliseconds): the hotness list is refreshed in
+    # background if missing or stale, without retries (the first requests may be waiting for it)
+    def warm_up(self):
+        if self._snapshot is None:
+            self.load_persisted()
+        if self.is_stale():
+            self.refresh_in_background(retries=0)
+
+    # it starts a refresh in a daemon thread, unless one is already running
+    def refresh_in_background(self, retries=None):
+        if self._refresh_lock.locked():
+            return False
+        threading.Thread(target=self.refresh, args=(retries,), name="hotness-refresh", daemon=True).start()
+        return True
+
+    def get(self):
+        snapshot = self._snapshot
+        if snapshot is None:
+            # a warm up may be running: wait for it instead of loading the hotness list twice
+            with self._refresh_lock:
+                snapshot = self._snapshot
+            snapshot = snapshot if snapshot is not None else self.refresh(retries=0)
+        elif self.is_stale():
+            # stale while revalidate: the stale snapshot is returned right away
+            self.refresh_in_background()
+        if snapshot is None:
+            logger.error("HOTNESS LIST IS EMPTY")
+            raise BggSuggestionException("😞💔 We had issues trying to get the hotness list from BGG. "
+                                         "Try again later or contact the administrator")
+        return snapshot
+
+    def status(self):
+        snapshot = self._snapshot
+        return {
+            "version": snapshot.version if snapshot is not None else None,
+            "boardgames": len(snapshot.boardgames) if snapshot is not None else 0,
+            "created_at": snapshot.created_at if snapshot is not None else None,
+            "age": time.time() - self.fetched_at if self.fetched_at is not None else None,
+            "stale": self.is_stale(),
+            "refreshing": self._refresh_lock.locked(),
+            "consecutive_failures": self.consecutive_failures,
+            "failures": self.failures,
+            "last_error": self.last_error
+        }
+
+
+hotness_manager = HotnessManager(path=HOTNESS_SNAPSHOT_PATH, loader_fetched_at=hot_boardgames_fetched_at)
@@ -0,0 +1,181 @@
+import logging
+import os
+import threading
+import time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+
+# the instrumentation is disabled by default: when disabled, every call returns immediately (and timer() returns a
+# shared no-op context manager), so the instrumented hot paths pay only a function call
+METRICS_ENABLED = os.environ.get("BGG_METRICS_ENABLED", "0").lower() in ["1", "true", "yes"]
+METRICS_PORT = int(os.environ.get("BGG_METRICS_PORT", "0"))  # 0: no HTTP endpoint, periodic log dump instead
+METRICS_LOG_INTERVAL = 15  # minutes
+
+# Enable logging
+logging.basicConfig(format='%(asctime)s - %(name)s - %(levelname)s - %(message)s', level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+class _NoopTimer(object):
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+_NOOP_TIMER = _NoopTimer()
+
+
+class _Timer(object):
+    def __init__(self, registry, name, labels):
+        self.registry = registry
+        self.name = name
+        self.labels = labels
+        self._start = None
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.registry.observe(self.name, time.perf_counter() - self._start, **self.labels)
+        return False
+
+
+def _labels_key(labels):
+    return tuple(sorted(labels.items()))
+
+
+def _format_labels(labels_key):
+    if len(labels_key) == 0:
+        return ""
+    return "{" + ",".join(f'{k}="{str(v)}"' for k, v in labels_key) + "}"
+
+
+# counters, summaries (count, sum and max of the observed values) and gauges (computed at export time by callbacks),
+# each one identified by name and labels, exported in the Prometheus text format
+class MetricsRegistry(object):
+    def __init__(self, enabled=METRICS_ENABLED):
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._summaries = {}
+        self._gauges = {}
+
+    def inc(self, name, value=1, **labels):
+        if not self.enabled:
+            return
+        key = (name, _labels_key(labels))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name, value, **labels):
+        if not self.enabled:
+            return
+        key = (name, _labels_key(labels))
+        with self._lock:
+            count, total, maximum = self._summaries.get(key, (0, 0.0, value))
+            self._summaries[key] = (count + 1, total + value, max(maximum, value))
+
+    # it observes, in the 'name' summary, the seconds spent in the with block
+    def timer(self, name="bgg_stage_seconds", **labels):
+        if not self.enabled:
+            return _NOOP_TIMER
+        return _Timer(self, name, labels)
+
+    # callback() is called at export time, it returns the gauge value (or None to skip it)
+    def gauge(self, name, callback, **labels):
+        with self._lock:
+            self._gauges[(name, _labels_key(labels))] = callback
+
+    def counter_value(self, name, **labels):
+        with self._lock:
+            return self._counters.get((name, _labels_key(labels)), 0)
+
+    def snapshot(self):
+        with self._lock:
+            counters = dict(self._counters)
+            summaries = dict(self._summaries)
+            gauges = dict(self._gauges)
+        gauges_values = {}
+        for key, callback in gauges.items():
+            try:
+                value = callback()
+            except Exception:
+                logger.exception(f"gauge {key[0]} failed")
+                value = None
+            if value is not None:
+                gauges_values[key] = value
+        return counters, summaries, gauges_values
+
+    def render_prometheus(self):
+        counters, summaries, gauges = self.snapshot()
+        lines = []
+        for metrics, type_ in [(counters, "counter"), (gauges, "gauge")]:
+            for name in sorted({n for n, _ in metrics}):
+                lines.append(f"# TYPE {name} {type_}")
+                for (n, labels_key), value in sorted(metrics.items()):
+                    if n == name:
+                        lines.append(f"{name}{_format_labels(labels_key)} {value}")
+        for name in sorted({n for n, _ in summaries}):
+            lines.append(f"# TYPE {name} summary")
+            for (n, labels_key), (count, total, maximum) in sorted(summaries.items()):
+                if n == name:
+                    lines.append(f"{name}_count{_format_labels(labels_key)} {count}")
+                    lines.append(f"{name}_sum{_format_labels(labels_key)} {total}")
+                    lines.append(f"{name}_max{_format_labels(labels_key)} {maximum}")
+        return "\n".join(lines) + "\n"
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._summaries.clear()
+
+
+registry = MetricsRegistry()
+
+
+# hits and misses of the named cache, its hit ratio is exported as a gauge once registered with register_cache()
+def count_cache_request(cache, hit, n=1):
+    registry.inc("bgg_cache_requests_total", value=n, cache=cache, result="hit" if hit else "miss")
+
+
+def cache_hit_ratio(cache):
+    hits = registry.counter_value("bgg_cache_requests_total", cache=cache, result="hit")
+    misses = registry.counter_value("bgg_cache_requests_total", cache=cache, result="miss")
+    return hits / (hits + misses) if hits + misses > 0 else None
+
+
+def register_cache(cache):
+    registry.gauge("bgg_cache_hit_ratio", lambda: cache_hit_ratio(cache), cache=cache)
+
+
+def log_metrics():
+    if registry.enabled:
+        logger.info("metrics:\n" + registry.render_prometheus())
+
+
+# it exposes the metrics on http://<host>:<port>/metrics (in a daemon thread)
+def start_http_server(port=METRICS_PORT, host="0.0.0.0"):
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.rstrip("/") != "/metrics":
+                self.send_response(404)
+                self.end_headers()
+                return
+            body = registry.render_prometheus().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format_, *args):
+            pass
+
+    httpd = ThreadingHTTPServer((host, port), MetricsHandler)
+    httpd.daemon_threads = True
+    threading.Thread(target=httpd.serve_forever, name="metrics", daemon=True).start()
+    logger.info(f"metrics exposed on http://{host}:{httpd.server_address[1]}/metrics")
+    return httpd
@@ -0,0 +1,50 @@
+import sys
+from typing import NamedTuple, Optional, Tuple
+
+
+# compact, immutable, records for the boardgames kept in the caches (hotness, collections...): NamedTuples have no
+# per-instance __dict__, and each distinct Feature is created once, in the global vocabulary below, and then shared
+# by all the games (and all the cached collections) having it
+class Feature(NamedTuple):
+    type: str
+    id: str
+    value: str
+
+
+class Game(NamedTuple):
+    id: str
+    name: str
+    features: Tuple[Feature, ...]
+    numplays: int = 0
+    rank: Optional[str] = None
+    description: Optional[str] = None
+    thumbnail: Optional[str] = None
+
+
+# global vocabulary of the features: (type, id, value) -> Feature
+_features_vocabulary = {}
+
+
+def intern_feature(type_, id_, value):
+    key = (type_, id_, value)
+    feature = _features_vocabulary.get(key)
+    if feature is None:
+        # setdefault: if two threads intern the same feature at the same time, both get the same instance
+        feature = _features_vocabulary.setdefault(key, Feature(
+            type=sys.intern(type_) if type_ is not None else None,
+            id=sys.intern(id_) if id_ is not None else None,
+            value=sys.intern(value) if value is not None else None
+        ))
+    return feature
+
+
+# it converts the features, as dicts {"type", "id", "value"} or Features, into a tuple of interned Features
+def intern_features(features):
+    return tuple(
+        intern_feature(f['type'], f['id'], f['value']) if isinstance(f, dict) else intern_feature(*f)
+        for f in features
+    )
+
+
+def features_vocabulary_size():
+    return len(_features_vocabulary)
@@ -1,72 +1,316 @@
-from apscheduler.schedulers.background import BackgroundScheduler
+import copy
 import logging
-import pandas as pd
-from core.bgg_api_manager import load_hot_boardgames, load_user_collection, get_boardgame_features, item_to_dict, \
-    check_hotness
+import multiprocessing
+import os
+import threading
+import cachetools
+from core.bgg_api_manager import load_user_collection, get_boardgames_features, item_to_game, \
+    get_collection_version, collection_key, submit_collection_fetch, iter_user_collection, is_collection_cached, \
+    COLLECTION_STREAM_CHUNK_SIZE
+from core.bgg_exceptions import BggSuggestionException
+from core.bgg_affinity import rank_vectorized, StreamingRanking
+from core.bgg_hotness import hotness_manager, HOTNESS_REFRESH_INTERVAL
+from core.bgg_catalog_index import catalog_manager, rank_catalog
+from core.bgg_metrics import registry as metrics_registry, count_cache_request, register_cache
+from core.bgg_records import Game
 
 
 TOP_N = 5
+# 'vectorized' computes the affinities as a sparse matrix product, 'pandas' is the original cross join + apply
+# version, kept in order to compare the results
+ENGINES = ['vectorized', 'pandas']
+# where the suggested boardgames come from: the hotness list (~50 boardgames) or the whole local catalog (all the
+# boardgames in the feature store, scored through an inverted index)
+SOURCES = ['hotness', 'catalog']
+# computed suggestions, reused while neither the hotness list nor the user's collection change
+RESULTS_CACHE_SIZE = 1000
 
 # Enable logging
 logging.basicConfig(format='%(asctime)s - %(name)s - %(levelname)s - %(message)s', level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-scheduler = BackgroundScheduler()
-scheduler.start()
+register_cache("results")
 
-scheduler.add_job(load_hot_boardgames, 'interval', minutes=60)
-logging.getLogger('apscheduler.executors.default').setLevel(logging.WARNING)
+# the background jobs scheduler, created and started by start_background_jobs() (nothing runs at import time)
+scheduler = None
+
+
+# it starts (once) the scheduler of the background jobs and it returns it, in order to add other jobs
+def start_background_jobs(hotness=hotness_manager, catalog=catalog_manager):
+    global scheduler
+    if scheduler is None:
+        from apscheduler.schedulers.background import BackgroundScheduler
+        scheduler = BackgroundScheduler()
+        scheduler.start()
+        # reload the hotness list and, if it changed, swap in a new precomputed hotness snapshot (the requests keep
+        # reading the current one meanwhile)
+        scheduler.add_job(hotness.refresh, 'interval', minutes=HOTNESS_REFRESH_INTERVAL)
+        # rebuild the catalog index (if in use) when the feature store changed
+        scheduler.add_job(catalog.refresh_if_loaded, 'interval', minutes=60)
+        logging.getLogger('apscheduler.executors.default').setLevel(logging.WARNING)
+    return scheduler
+
+
+# state of the batch scoring worker processes: the candidates (hotness snapshot or catalog index), inherited (not
+# copied) from the parent when the processes are forked. The collections to score are sent as the tasks
+_batch_state = None
+
+
+def _init_batch_worker(source, candidates, mode, top_n, format_):
+    global _batch_state
+    _batch_state = (source, candidates, mode, top_n, format_)
+
+
+def _score_batch_item(item):
+    source, candidates, mode, top_n, format_ = _batch_state
+    key, liked_boardgames = item
+    try:
+        if source == 'catalog':
+            ranked_df = rank_catalog(candidates, liked_boardgames, mode=mode)
+        else:
+            ranked_df = rank_vectorized(candidates, liked_boardgames, mode=mode)
+        return key, BggSuggestions._get_top_n(ranked_df, n=top_n, format_=format_)
+    except BggSuggestionException as e:
+        return key, e
 
 
 class BggSuggestions(object):
-    def __init__(self):
-        # get hot boardgames
-        self.hot_boardgames_df = pd.DataFrame(load_hot_boardgames())
+    def __init__(self, engine='vectorized', hotness=hotness_manager, source='hotness', catalog=catalog_manager):
+        if engine not in ENGINES:
+            raise AttributeError(f"engine '{engine}' not in allowed ones: {ENGINES}")
+        if source not in SOURCES:
+            raise AttributeError(f"source '{source}' not in allowed ones: {SOURCES}")
+        self.engine = engine
+        self.source = source
+        self.catalog = catalog
+        # warm up the hot boardgames (and the catalog index) without waiting: from the persisted snapshot, if any, and
+        # in background. A request arriving before the end of the warm-up waits for it
+        self.hotness = hotness
+        self.hotness.warm_up()
+        if self.source == 'catalog':
+            self.catalog.warm_up()
         self.filters = ["own", "want", "wanttoplay", "wanttobuy", "wishlist", "preordered"]
+        # key -> (versions, result), where versions are the hotness (or catalog) and collection versions the result
+        # comes from: a result computed from an older hotness list or collection is never returned, it is recomputed
+        self.results_cache = cachetools.LRUCache(maxsize=RESULTS_CACHE_SIZE)
+        self._results_lock = threading.Lock()
 
-    def suggest_from_boardgame(self, boardgame_id, top_n=5, format_='dict'):
-        _, (boardgame_name) = get_boardgame_features(boardgame_id, additional_info=['name'])
-        features = get_boardgame_features(boardgame_id)
-        numplays = 0
-        liked_boardgames_df = pd.DataFrame([item_to_dict(boardgame_id, boardgame_name, features, numplays)])
+    def _candidates_version(self):
+        if self.source == 'catalog':
+            return self.catalog.get().version
+        return self.hotness.get().version
 
-        # calculate the hotness ranking according to the user's liked board games
-        ranked_df = self._get_ranked(liked_boardgames_df)
+    def _cached_result(self, key, versions, compute):
+        with self._results_lock:
+            cached = self.results_cache.get(key)
+        hit = cached is not None and cached[0] == versions
+        count_cache_request("results", hit=hit)
+        if hit:
+            result = cached[1]
+        else:
+            result = compute()
+            # an unknown version (eg: the collection expired meanwhile) can't tell when the result gets stale
+            if None not in versions:
+                with self._results_lock:
+                    self.results_cache[key] = (versions, result)
+        # the callers may modify the result (eg: the dataframe format)
+        return copy.deepcopy(result)
 
-        # format result according to the TOP N and the desired format
-        result = BggSuggestions._get_top_n(ranked_df, n=top_n, format_=format_)
+    def suggest_from_boardgame(self, boardgame_id, top_n=5, format_='dict', mode='sum_weighted'):
+        def compute():
+            # a single /thing request returns both the features and the name
+            with metrics_registry.timer(stage="load_boardgame"):
+                boardgame_features = get_boardgames_features([boardgame_id], additional_info=['name'])
+            if str(boardgame_id) not in boardgame_features:
+                raise BggSuggestionException(f"🎲⛔ Boardgame '{boardgame_id}' not found")
+            features, boardgame_name = boardgame_features[str(boardgame_id)]
+            numplays = 0
 
-        return result
+            return self.suggest_from_collection(
+                [item_to_game(boardgame_id, boardgame_name, features, numplays)], top_n=top_n, format_=format_,
+                mode=mode
+            )
+
+        # the boardgame features never change, only the hotness list (or the catalog) does
+        key = ("boardgame", str(boardgame_id), mode, top_n, format_)
+        return self._cached_result(key, (self._candidates_version(),), compute)
 
-    def suggest_from_user(self, username, top_n=5, format_='dict'):
-        # get user's collection.
-        liked_boardgames_df = pd.DataFrame(load_user_collection(username, filters=self.filters))
+    def suggest_from_user(self, username, top_n=5, format_='dict', mode='sum_weighted'):
+        # get user's collection (it is cached too, the collection version changes only if the collection changed)
+        with metrics_registry.timer(stage="load_collection"):
+            liked_boardgames = load_user_collection(username, filters=self.filters)
 
+        key = ("user", collection_key(username), tuple(self.filters), mode, top_n, format_)
+        versions = (self._candidates_version(), get_collection_version(username))
+        return self._cached_result(
+            key, versions,
+            lambda: self.suggest_from_collection(liked_boardgames, top_n=top_n, format_=format_, mode=mode)
+        )
+
+    # streaming version of suggest_from_user, for large collections: the collection is loaded chunk_size liked
+    # boardgames at a time and each chunk is scored as soon as its features are loaded (see StreamingRanking). It
+    # yields (liked boardgames scored so far, provisional top_n) after each chunk, the last one is the final result
+    # (the suggest_from_user one, stored in the results cache as well). A result already in the results cache (same
+    # key and versions of suggest_from_user) is yielded right away as the single, final, item
+    # NB: only the 'hotness' source and the 'vectorized' engine are supported
+    def iter_suggestions_from_user(self, username, top_n=5, format_='dict', mode='sum_weighted',
+                                   chunk_size=COLLECTION_STREAM_CHUNK_SIZE):
+        if self.source != 'hotness':
+            raise AttributeError(f"streaming suggestions are not available for the source '{self.source}'")
+        # the same hotness snapshot for the whole stream, even if a new one is swapped in meanwhile
+        hotness_snapshot = self.hotness.get()
+        key = ("user", collection_key(username), tuple(self.filters), mode, top_n, format_)
+        if is_collection_cached(username):
+            versions = (hotness_snapshot.version, get_collection_version(username))
+            with self._results_lock:
+                cached = self.results_cache.get(key)
+            if cached is not None and cached[0] == versions:
+                count_cache_request("results", hit=True)
+                yield len(load_user_collection(username, filters=self.filters)), copy.deepcopy(cached[1])
+                return
+        count_cache_request("results", hit=False)
+
+        ranking = StreamingRanking(hotness_snapshot, mode=mode)
+        result = None
+        for liked_boardgames in iter_user_collection(username, filters=self.filters, chunk_size=chunk_size):
+            with metrics_registry.timer(stage="rank_chunk"):
+                ranking.add(liked_boardgames)
+            with metrics_registry.timer(stage="format"):
+                result = self._get_top_n(ranking.ranked(), n=top_n, format_=format_)
+            yield ranking.n_liked, copy.deepcopy(result)
+
+        collection_version = get_collection_version(username)
+        if collection_version is not None:
+            with self._results_lock:
+                self.results_cache[key] = ((hotness_snapshot.version, collection_version), result)
+
+    # batch version of suggest_from_user/suggest_from_collection (eg: nightly precomputation for all the active users):
+    # - usernames: their collections are loaded here (concurrently fetched, through the same caches)
+    # - collections: {key: liked_boardgames} already loaded
+    # the scoring runs in a pool of 'processes' processes (default: one per core) sharing the current hotness snapshot
+    # (or catalog index) read-only. It returns {username or key: result}, where the users that failed map to the
+    # BggSuggestionException. The users' results are also stored in the results cache
+    # NB: the workers always score with the 'vectorized' engine (same results of the 'pandas' one)
+    def suggest_for_users(self, usernames=None, collections=None, top_n=5, format_='dict', mode='sum_weighted',
+                          processes=None):
+        usernames = list(dict.fromkeys(usernames or []))
+        results = {}
+        items = list((collections or {}).items())
+        candidates = self.catalog.get() if self.source == 'catalog' else self.hotness.get()
+        candidates_version = candidates.version
+
+        # the collections fetches are started together, BGG prepares them in parallel
+        for username in usernames:
+            submit_collection_fetch(username)
+        users_versions = {}
+        for username in usernames:
+            try:
+                with metrics_registry.timer(stage="load_collection"):
+                    items.append((username, load_user_collection(username, filters=self.filters)))
+                users_versions[username] = get_collection_version(username)
+            except BggSuggestionException as e:
+                results[username] = e
+
+        processes = processes or os.cpu_count() or 1
+        init_args = (self.source, candidates, mode, top_n, format_)
+        with metrics_registry.timer(stage="batch_scoring", processes=processes):
+            if processes == 1 or len(items) < 2:
+                _init_batch_worker(*init_args)
+                scored = [_score_batch_item(item) for item in items]
+                _init_batch_worker(*[None] * len(init_args))
+            else:
+                # fork (when available): the children inherit the candidates without copying them. pandas (lazily
+                # imported by the rankings) is imported here, before forking: a forked child never runs an import,
+                # so it can't block on an import lock held by another thread of this process
+                import pandas  # noqa: F401
+                methods = multiprocessing.get_all_start_methods()
+                context = multiprocessing.get_context('fork' if 'fork' in methods else None)
+                chunksize = max(1, len(items) // (processes * 4))
+                with context.Pool(processes, initializer=_init_batch_worker, initargs=init_args) as pool:
+                    scored = list(pool.imap_unordered(_score_batch_item, items, chunksize=chunksize))
+
+        for key, result in scored:
+            results[key] = result
+            if users_versions.get(key) is not None and not isinstance(result, BggSuggestionException):
+                cache_key = ("user", collection_key(key), tuple(self.filters), mode, top_n, format_)
+                with self._results_lock:
+                    self.results_cache[cache_key] = ((candidates_version, users_versions[key]), copy.deepcopy(result))
+        logger.info(f"batch suggestions for {len(results)} users "
+                    f"({sum(isinstance(r, BggSuggestionException) for r in results.values())} failed)")
+        return results
+
+    # liked_boardgames: sequence of Game (eg: a collection already loaded with load_user_collection)
+    def suggest_from_collection(self, liked_boardgames, top_n=5, format_='dict', mode='sum_weighted'):
         # calculate the hotness ranking according to the user's liked board games
-        ranked_df = self._get_ranked(liked_boardgames_df)
+        with metrics_registry.timer(stage="rank", engine=self.engine, source=self.source):
+            ranked_df = self._get_ranked(liked_boardgames, mode=mode)
 
         # format result according to the TOP N and the desired format
-        result = BggSuggestions._get_top_n(ranked_df, n=top_n, format_=format_)
+        with metrics_registry.timer(stage="format", format_=format_):
+            result = BggSuggestions._get_top_n(ranked_df, n=top_n, format_=format_)
 
         return result
 
-    def _get_ranked(self, liked_boardgames_df: pd.DataFrame, mode='sum_weighted'):
-        # check if hotness list is ok
-        check_hotness()
+    def _get_ranked(self, liked_boardgames, mode='sum_weighted', engine=None):
+        engine = engine or self.engine
+        if engine not in ENGINES:
+            raise AttributeError(f"engine '{engine}' not in allowed ones: {ENGINES}")
+
+        if self.source == 'catalog':
+            # the inverted index scores only the catalog boardgames sharing features with the liked ones
+            catalog_index = self.catalog.get()
+            with metrics_registry.timer(stage="rank_catalog"):
+                return rank_catalog(catalog_index, liked_boardgames, mode=mode)
+
+        # get the current hotness snapshot (it raises if the hotness list is empty)
+        hotness_snapshot = self.hotness.get()
+        # size of the (possibly implicit) cross join hot boardgames x liked boardgames
+        metrics_registry.observe(
+            "bgg_cross_join_pairs", len(hotness_snapshot.boardgames) * len(liked_boardgames), engine=engine
+        )
 
+        if engine == 'vectorized':
+            return rank_vectorized(hotness_snapshot, liked_boardgames, mode=mode)
+
+        import pandas as pd
         # merge the two DFs hot_boardgames_df and liked_boardgames_df in a cross join way => each hot bg with every
         # liked bg in this way we are ready to calculate the affinity for each couple of boardgames
-        total_df = self.hot_boardgames_df.merge(liked_boardgames_df, how='cross', suffixes=('_hot', '_liked'))
+        hot_boardgames_df = pd.DataFrame(list(hotness_snapshot.boardgames), columns=Game._fields)[
+            ["id", "name", "features", "description", "thumbnail"]
+        ]
+        liked_boardgames_df = pd.DataFrame(list(liked_boardgames), columns=Game._fields)[
+            ["id", "name", "features", "numplays"]
+        ]
+        with metrics_registry.timer(stage="cross_join"):
+            total_df = hot_boardgames_df.merge(liked_boardgames_df, how='cross', suffixes=('_hot', '_liked'))
 
         # calculate now the affinity for each couple hot_boardgame - liked_boardgame and add to the total_df
         # the corresponding affinity and common features that contributed to obtain that affinity
-        total_df[['affinity', 'comm_features']] = total_df.apply(self.calculate_affinity, result_type='expand', axis=1)
+        with metrics_registry.timer(stage="calculate_affinity"):
+            total_df[['affinity', 'comm_features']] = total_df.apply(
+                self.calculate_affinity, result_type='expand', axis=1
+            )
 
         # convert total_df dataframe into ranked_df according to the mode (max, sum of weighted...)
-        ranked_df = BggSuggestions.affinity_handler(total_df, mode=mode)
+        with metrics_registry.timer(stage="affinity_handler"):
+            ranked_df = BggSuggestions.affinity_handler(total_df, mode=mode)
 
         return ranked_df
 
+    # a suggestion in the 'dict' format as markdown text
+    @staticmethod
+    def to_markdown(el):
+        s = f"*{el['name_hot']}* ({el['total_affinity']:.2f}) \n" \
+            f"🔗 https://boardgamegeek.com/boardgame/{el['id_hot']} \n"
+        s += "❤ because you also like:"
+        for o in el['because_you_also_like']:
+            s += f"\n - '_{o[0]}_' ({float(o[2]):.2f}) with "
+            for cf in o[1][0:3]:
+                s += f"{cf}, "
+            s += "..."
+        s += "\n..."
+        return s
+
     @staticmethod
     def _get_top_n(suggestions, n=5, format_='dict'):
         base = suggestions.head(n).reset_index(drop=False)
@@ -75,18 +319,9 @@ class BggSuggestions(object):
         if format_ == 'dataframe':
             return base
         if format_ == 'markdown':
-            def text_format(el):
-                s = f"*{el['name_hot']}* ({el['total_affinity']:.2f}) \n" \
-                    f"🔗 https://boardgamegeek.com/boardgame/{el['id_hot']} \n"
-                s += "❤ because you also like:"
-                for o in el['because_you_also_like']:
-                    s += f"\n - '_{o[0]}_' ({float(o[2]):.2f}) with "
-                    for cf in o[1][0:3]:
-                        s += f"{cf}, "
-                    s += "..."
-                s += "\n..."
-                return s
-            return [text_format(el) for el in BggSuggestions._get_top_n(suggestions, n=n, format_='dict')]
+            return [
+                BggSuggestions.to_markdown(el) for el in BggSuggestions._get_top_n(suggestions, n=n, format_='dict')
+            ]
         else:
             raise AttributeError("unexpected value for attribute 'format_'")
 
@@ -98,11 +333,11 @@ class BggSuggestions(object):
         hot_boardgame, liked_boardgame = x['features_hot'], x['features_liked']
         n_features = 0
         common_features = []
-        liked_boardgame_features_id = [f['value'] for f in liked_boardgame]
+        liked_boardgame_features_id = [f.value for f in liked_boardgame]
         for hot_boardgame_feature in hot_boardgame:
             n_features += 1
-            if hot_boardgame_feature['value'] in liked_boardgame_features_id:
-                common_features.append(hot_boardgame_feature['value'])
+            if hot_boardgame_feature.value in liked_boardgame_features_id:
+                common_features.append(hot_boardgame_feature.value)
         if n_features > 0:
             affinity = len(common_features) / n_features
         else:
@@ -149,5 +384,6 @@ class BggSuggestions(object):
             .reset_index() \
             .rename({affinity_col: 'total_affinity'}, axis=1)
 
-        # FINAL SORTING
-        return ranked_df.sort_values('total_affinity', ascending=False, ignore_index=True)
+        # FINAL SORTING (stable, by id_hot on ties: the same order of the vectorized engine)
+        return ranked_df.sort_values('id_hot', kind='stable') \
+            .sort_values('total_affinity', ascending=False, kind='stable', ignore_index=True)
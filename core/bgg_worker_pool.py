@@ -0,0 +1,108 @@
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, Future
+from core.bgg_exceptions import BggSuggestionException, BggBusyException, BggDuplicateRequestException
+from core.bgg_metrics import registry as metrics_registry
+
+
+WORKER_POOL_SIZE = int(os.environ.get("BGG_WORKER_POOL_SIZE", "8"))  # jobs running at the same time
+WORKER_POOL_MAX_QUEUED = int(os.environ.get("BGG_WORKER_POOL_MAX_QUEUED", "32"))  # jobs accepted but not running yet
+
+# Enable logging
+logging.basicConfig(format='%(asctime)s - %(name)s - %(levelname)s - %(message)s', level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+# bounded pool for the slow (BGG bound) jobs of the bot handlers:
+# - at most max_workers jobs run at the same time and at most max_queued more are accepted (waiting for a worker or
+#   for the 'after' future), beyond that submit() raises BggBusyException instead of queueing without limits
+# - a job is identified by a key (eg: user and command): while a job with the same key is pending, submit() raises
+#   BggDuplicateRequestException, so repeated taps don't queue the same work again
+class WorkerPool(object):
+    def __init__(self, max_workers=WORKER_POOL_SIZE, max_queued=WORKER_POOL_MAX_QUEUED, name="bgg-worker"):
+        if max_workers < 1 or max_queued < 0:
+            raise AttributeError(f"max_workers must be positive and max_queued not negative, "
+                                 f"got {max_workers} and {max_queued}")
+        self.max_workers = max_workers
+        self.max_queued = max_queued
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=name)
+        self._lock = threading.Lock()
+        self._pending = {}  # key -> Future, from the submission to the end of the job
+        self._running = 0
+        # stats
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.deduplicated = 0
+
+        metrics_registry.gauge("bgg_worker_pool_size", lambda: self.max_workers, pool=name)
+        metrics_registry.gauge("bgg_worker_pool_running", lambda: self.stats()["running"], pool=name)
+        metrics_registry.gauge("bgg_worker_pool_queued", lambda: self.stats()["queued"], pool=name)
+
+    # it runs function(*args) on a worker and returns a Future with its result; if 'after' (a Future) is given, the
+    # job is scheduled only once 'after' is done and it receives it as its last argument
+    def submit(self, key, function, *args, after=None):
+        with self._lock:
+            if key in self._pending:
+                self.deduplicated += 1
+                metrics_registry.inc("bgg_worker_pool_deduplicated_total")
+                raise BggDuplicateRequestException("⏳ I'm still working on your previous request, please wait")
+            if len(self._pending) >= self.max_workers + self.max_queued:
+                self.rejected += 1
+                metrics_registry.inc("bgg_worker_pool_rejected_total")
+                logger.warning(f"worker pool full, rejecting {key}")
+                raise BggBusyException("🚦 Too many requests right now, try again in a few minutes")
+            result = Future()
+            self._pending[key] = result
+
+        def run(*run_args):
+            if not result.set_running_or_notify_cancel():
+                self._done(key)
+                return
+            with self._lock:
+                self._running += 1
+            try:
+                result.set_result(function(*run_args))
+                with self._lock:
+                    self.completed += 1
+            except BaseException as e:
+                with self._lock:
+                    self.failed += 1
+                if not isinstance(e, BggSuggestionException):
+                    logger.exception(f"job {key} failed")
+                result.set_exception(e)
+            finally:
+                with self._lock:
+                    self._running -= 1
+                self._done(key)
+
+        if after is None:
+            self._executor.submit(run, *args)
+        else:
+            after.add_done_callback(lambda future: self._executor.submit(run, *args, future))
+        return result
+
+    def _done(self, key):
+        with self._lock:
+            self._pending.pop(key, None)
+
+    def is_pending(self, key):
+        with self._lock:
+            return key in self._pending
+
+    def stats(self):
+        with self._lock:
+            return {
+                "size": self.max_workers,
+                "max_queued": self.max_queued,
+                "running": self._running,
+                "queued": len(self._pending) - self._running,
+                "completed": self.completed,
+                "failed": self.failed,
+                "rejected": self.rejected,
+                "deduplicated": self.deduplicated
+            }
+
+    def shutdown(self, wait=True):
+        self._executor.shutdown(wait=wait)
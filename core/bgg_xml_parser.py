@@ -0,0 +1,86 @@
+from io import BytesIO
+from lxml import etree
+from core.bgg_exceptions import BggApiErrorException
+
+
+# streaming parsers of the BGG XML API responses: instead of building the whole tree (multiple times the size of the
+# response for the big collections), each <item> is converted into a compact record as soon as it is complete and
+# then it is cleared, together with the already processed siblings
+
+def _iter_elements(content, tags):
+    if content is None or len(content.strip()) == 0:
+        return
+    for _, element in etree.iterparse(BytesIO(content), events=('end',), tag=tags, recover=True, huge_tree=True):
+        if element.tag == 'errors':
+            messages = [m.text for m in element.iter('message')] or [etree.tostring(element, method='text')]
+            raise BggApiErrorException("; ".join(str(m) for m in messages))
+        yield element
+        element.clear()
+        while element.getprevious() is not None:
+            del element.getparent()[0]
+
+
+def _child_info(element, tag):
+    # same semantic of the original BeautifulSoup code: the text of the tag or, if empty, its 'value' attribute
+    child = next(element.iter(tag), None)
+    if child is None:
+        return None
+    return child.text or child.get('value')
+
+
+# /hot: {"id", "rank", "name", "thumbnail", "yearpublished"} for each hot boardgame
+def iter_hot_items(content):
+    for item in _iter_elements(content, ('item', 'errors')):
+        yield {
+            "id": item.get('id'),
+            "rank": item.get('rank'),
+            "name": _child_info(item, 'name'),
+            "thumbnail": _child_info(item, 'thumbnail'),
+            "yearpublished": _child_info(item, 'yearpublished')
+        }
+
+
+# /search: {"id", "name", "year"} for each result
+def iter_search_items(content):
+    for item in _iter_elements(content, ('item', 'errors')):
+        yield {
+            "id": item.get('id'),
+            "name": _child_info(item, 'name'),
+            "year": _child_info(item, 'yearpublished') or 'unknown'
+        }
+
+
+# /thing: (id, {"features": [{"type", "id", "value"}...], <info>: ...}) for each boardgame, where the <info> keys are
+# the requested additional_info (eg: 'name', 'description', 'thumbnail'). With types, only the items of those types
+# (eg: 'boardgame', 'boardgameexpansion') are returned
+def iter_thing_items(content, additional_info=(), types=None):
+    for item in _iter_elements(content, ('item', 'errors')):
+        if types is not None and item.get('type') not in types:
+            continue
+        record = {
+            "features": [
+                {
+                    "type": link.get("type"),
+                    "id": link.get("id"),
+                    "value": link.get("value")
+                } for link in item.iter('link')
+            ]
+        }
+        for a in additional_info:
+            record[a] = _child_info(item, a)
+        yield item.get('id'), record
+
+
+# /collection: {"id", "collid", "name", "numplays", "status": {"own": 1, "want": 0...}} for each boardgame in the
+# collection (collid identifies the collection entry: the same boardgame can be in a collection more than once)
+# NB: it raises BggApiErrorException if the response contains <errors> (eg: invalid username)
+def iter_collection_items(content):
+    for item in _iter_elements(content, ('item', 'errors')):
+        status = item.find('status')
+        yield {
+            "id": item.get('objectid'),
+            "collid": item.get('collid'),
+            "name": _child_info(item, 'name'),
+            "numplays": int(_child_info(item, 'numplays') or 0),
+            "status": {k: int(v) for k, v in status.attrib.items() if v.isdigit()} if status is not None else {}
+        }
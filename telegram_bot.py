@@ -2,9 +2,14 @@
 
 import logging
 import json
-from core.bgg_suggestions import BggSuggestions
-from core.bgg_api_manager import search_boardgame
+import time
+from core.bgg_suggestions import BggSuggestions, start_background_jobs
+from core.bgg_api_manager import search_boardgame, submit_collection_fetch, is_collection_cached, \
+    collection_fetch_exception
 from core.bgg_exceptions import BggSuggestionException
+from core import bgg_metrics
+from core.bgg_metrics import registry as metrics_registry
+from core.bgg_worker_pool import WorkerPool
 from telegram import InlineKeyboardButton, InlineKeyboardMarkup, Update
 from telegram.ext import CommandHandler, MessageHandler, Filters, ConversationHandler, Updater, CallbackQueryHandler
 from telegram_resources.strings import EnglishStrings as language
@@ -15,6 +20,18 @@ logger = logging.getLogger(__name__)
 
 TOKEN = json.load(open("resources/telegram_token.json"))['TOKEN']
 CHOOSING, TYPING_CHOICE = range(2)
+# for large collections, the provisional suggestions are shown (and refined) at most every STREAM_UPDATE_INTERVAL
+# seconds while the collection is still being processed
+STREAM_UPDATE_INTERVAL = 3  # seconds
+
+# the handlers only reply and submit the slow (BGG bound) work to this bounded pool, so the dispatcher is never blocked
+# by a user with a huge collection (size and queue depth: BGG_WORKER_POOL_SIZE and BGG_WORKER_POOL_MAX_QUEUED)
+worker_pool = WorkerPool()
+
+
+# one pending job per user and command: the repeated taps are answered without queueing the same work again
+def job_key(update: Update, command):
+    return update.effective_user.id, command
 
 
 def start_command(update: Update, context):
@@ -33,17 +50,57 @@ def suggest_from_username(update: Update, context):
     update.message.reply_text(language.INTRO_MESSAGE.format(thing=f"{username}'s BGG collection"))
     logger.info(f"get suggestions for user '{username}'")
     try:
-        suggestions = bgg_suggestions.suggest_from_user(username=username, format_="markdown")
-        for suggestion in suggestions:
-            update.message.reply_text(suggestion, parse_mode='Markdown')
+        # the collection is fetched (and retried while BGG queues it) without holding a worker: the job starts as
+        # soon as it is ready
+        collection_future = None if is_collection_cached(username) else submit_collection_fetch(username)
+        worker_pool.submit(
+            job_key(update, "username"), send_suggestions_from_username, update, username, after=collection_future
+        )
     except BggSuggestionException as e:
         update.message.reply_text(str(e))
-        return CHOOSING
+
+    return ConversationHandler.END
+
+
+def send_suggestions_from_username(update: Update, username, collection_future=None):
+    """Send the suggestions for the username, once their collection is ready."""
+    try:
+        if collection_future is not None and collection_future.exception() is not None:
+            raise collection_fetch_exception(username, collection_future.exception())
+        with metrics_registry.timer(stage="handler", handler="username"):
+            suggestions = send_provisional_suggestions(update, username)
+        with metrics_registry.timer(stage="reply", handler="username"):
+            for suggestion in suggestions:
+                update.message.reply_text(BggSuggestions.to_markdown(suggestion), parse_mode='Markdown')
+    except BggSuggestionException as e:
+        metrics_registry.inc("bgg_handler_errors_total", handler="username", kind="suggestion")
+        update.message.reply_text(str(e))
+        update.message.reply_text(language.RETRY_USERNAME)
     except (BaseException, ValueError) as e:
+        metrics_registry.inc("bgg_handler_errors_total", handler="username", kind="generic")
         update.message.reply_text("Generic error occurred")
         raise e
 
-    return ConversationHandler.END
+
+def send_provisional_suggestions(update: Update, username):
+    """Show the provisional suggestions while the collection is processed, return the final ones."""
+    progress_message = None
+    last_update = time.monotonic()
+    suggestions, analyzed = [], 0
+    for analyzed, suggestions in bgg_suggestions.iter_suggestions_from_user(username=username):
+        if time.monotonic() - last_update < STREAM_UPDATE_INTERVAL:
+            continue
+        last_update = time.monotonic()
+        text = language.PROVISIONAL_SUGGESTIONS.format(analyzed=analyzed, suggestions="\n".join(
+            f"{i}. {s['name_hot']} ({s['total_affinity']:.2f})" for i, s in enumerate(suggestions, 1)
+        ))
+        if progress_message is None:
+            progress_message = update.message.reply_text(text)
+        else:
+            progress_message.edit_text(text)
+    if progress_message is not None:
+        progress_message.edit_text(language.FINAL_SUGGESTIONS.format(analyzed=analyzed))
+    return suggestions
 
 
 def suggest_from_boardgame(update: Update, context):
@@ -54,21 +111,34 @@ def suggest_from_boardgame(update: Update, context):
     # Some clients may have trouble otherwise. See https://core.telegram.org/bots/api#callbackquery
     query.answer()
     boardgame_id = int(query.data)
+    query.message.reply_text(language.INTRO_MESSAGE.format(thing="the selected boardgame"))
     try:
-        suggestions = bgg_suggestions.suggest_from_boardgame(boardgame_id, format_="markdown")
-        for suggestion in suggestions:
-            query.message.reply_text(suggestion, parse_mode='Markdown')
-            # update.message.reply_text(suggestion)
+        worker_pool.submit(job_key(update, "boardgame"), send_suggestions_from_boardgame, query.message, boardgame_id)
     except BggSuggestionException as e:
-        update.message.reply_text(str(e))
+        query.message.reply_text(str(e))
         return CHOOSING
-    except (BaseException, ValueError) as e:
-        update.message.reply_text("Generic error occurred")
-        raise e
 
     return ConversationHandler.END
 
 
+def send_suggestions_from_boardgame(message, boardgame_id):
+    """Send the suggestions for the selected boardgame."""
+    try:
+        with metrics_registry.timer(stage="handler", handler="boardgame"):
+            suggestions = bgg_suggestions.suggest_from_boardgame(boardgame_id, format_="markdown")
+        with metrics_registry.timer(stage="reply", handler="boardgame"):
+            for suggestion in suggestions:
+                message.reply_text(suggestion, parse_mode='Markdown')
+    except BggSuggestionException as e:
+        metrics_registry.inc("bgg_handler_errors_total", handler="boardgame", kind="suggestion")
+        message.reply_text(str(e))
+        message.reply_text(language.RETRY_BOARDGAME)
+    except (BaseException, ValueError) as e:
+        metrics_registry.inc("bgg_handler_errors_total", handler="boardgame", kind="generic")
+        message.reply_text("Generic error occurred")
+        raise e
+
+
 def error(update: Update, context):
     """Log Errors caused by Updates."""
     logger.warning('Update "%s" caused error "%s"', update, context.error)
@@ -89,7 +159,17 @@ def boardgame_selection_from_name(update: Update, context):
     update.message.reply_text(language.INTRO_MESSAGE.format(thing=str(boardgame).capitalize()))
     logger.info(f"get suggestions for boardgame '{boardgame}'")
     try:
-        results = search_boardgame(boardgame)
+        worker_pool.submit(job_key(update, "search"), send_search_results, update, boardgame)
+    except BggSuggestionException as e:
+        update.message.reply_text(str(e))
+    return CHOOSING
+
+
+def send_search_results(update: Update, boardgame):
+    """Send the boardgames matching the name, to choose among."""
+    try:
+        with metrics_registry.timer(stage="handler", handler="search"):
+            results = search_boardgame(boardgame)
         keyboard = [
             [InlineKeyboardButton(f"{r['name']} ({r['year']})", callback_data=r['id'])] for r in results
         ]
@@ -97,7 +177,6 @@ def boardgame_selection_from_name(update: Update, context):
         update.message.reply_text(language.OPTION, reply_markup=reply_markup)
     except BggSuggestionException as e:
         update.message.reply_text(str(e))
-        return CHOOSING
     except (BaseException, ValueError) as e:
         update.message.reply_text("Generic error occurred")
         raise e
@@ -156,5 +235,12 @@ def conversation():
 
 
 if __name__ == '__main__':
+    scheduler = start_background_jobs()
+    # metrics (if enabled via BGG_METRICS_ENABLED) on http://<host>:BGG_METRICS_PORT/metrics or periodically logged
+    if metrics_registry.enabled:
+        if bgg_metrics.METRICS_PORT > 0:
+            bgg_metrics.start_http_server()
+        else:
+            scheduler.add_job(bgg_metrics.log_metrics, 'interval', minutes=bgg_metrics.METRICS_LOG_INTERVAL)
     bgg_suggestions = BggSuggestions()
     conversation()
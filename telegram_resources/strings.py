@@ -21,5 +21,9 @@ class EnglishStrings(object):
                        "EG: if your username is 'test001', just send it as it is"
     ASK_FOR_BOARDGAME_NAME = "📝 Ok, tell me the name of the boardgame\n" \
                              "EG: if you want to get suggestions related to 'Takenoko', just send it"
+    RETRY_USERNAME = "🔁 Use the /username command to try again"
+    RETRY_BOARDGAME = "🔁 Use the /boardgame command to try again"
     INTRO_MESSAGE = "⌛ A list of suggestion related to {thing} is coming..."
+    PROVISIONAL_SUGGESTIONS = "⏳ {analyzed} boardgames analyzed so far, the best ones for now:\n{suggestions}"
+    FINAL_SUGGESTIONS = "✅ {analyzed} boardgames analyzed, here are your suggestions"
     OPTION = '🔀 Which one of these are you referring at?'